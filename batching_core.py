@@ -0,0 +1,105 @@
+# batching_core.py — dynamic micro-batching for the metric models
+# When many students submit at once, each submit used to run its own one-pair encode /
+# BERTScore forward pass. A MicroBatcher sits in front of such a batch function:
+# callers hand it their items and block on a future while one worker thread collects
+# the requests arriving within EDUAPP_BATCH_WAIT_MS (default 5 ms) of the first one, up
+# to EDUAPP_BATCH_MAX items (default 64), runs them as one batch and hands each caller
+# its slice of the results. A lone request waits at most the window; a full batch
+# goes at once. EDUAPP_BATCH_WAIT_MS=0 turns batching off (direct calls).
+# metrics_core batches sentence encoding and BERTScore this way, in the app processes
+# and in the shared model server (serving_core.py) alike.
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+def _wait_sec() -> float:
+    return max(0.0, float(os.getenv("EDUAPP_BATCH_WAIT_MS", "5")) / 1000)
+
+def _max_items() -> int:
+    return max(1, int(os.getenv("EDUAPP_BATCH_MAX", "64")))
+
+class MicroBatcher:
+    """
+    Coalesces concurrent run(items) calls into batch_fn(all items) calls. batch_fn
+    returns one result per item, or None (then every caller in the batch gets None);
+    an exception is raised in every caller of the batch. A request is never split,
+    so one larger than the maximum runs as a batch of its own.
+    """
+
+    def __init__(self, name: str, batch_fn, max_items: int | None = None, wait_sec: float | None = None):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_items = max_items or _max_items()
+        self.wait_sec = _wait_sec() if wait_sec is None else wait_sec
+        self.batches = 0   # batch_fn calls so far
+        self.requests = 0  # run() calls served by them
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def run(self, items: list):
+        """batch_fn's results for items, computed together with any concurrent requests."""
+        items = list(items)
+        if not items:
+            return []
+        if self.wait_sec <= 0:
+            self._count(1)
+            return self.batch_fn(items)
+        future = Future()
+        self._queue.put((items, future))
+        self._ensure_worker()
+        return future.result()
+
+    def stats(self) -> dict:
+        return {"name": self.name, "batches": self.batches, "requests": self.requests,
+                "mean_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else None}
+
+    def _count(self, requests: int):
+        with self._lock:
+            self.batches += 1
+            self.requests += requests
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name=f"batch-{self.name}", daemon=True)
+                    self._thread.start()
+
+    def _loop(self):
+        held = None  # a request that didn't fit the previous batch starts the next one
+        while True:
+            batch = [held if held is not None else self._queue.get()]
+            held = None
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.wait_sec
+            while size < self.max_items:
+                try:
+                    nxt = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if size + len(nxt[0]) > self.max_items:
+                    held = nxt
+                    break
+                batch.append(nxt)
+                size += len(nxt[0])
+            self._run(batch)
+
+    def _run(self, batch):
+        batch = [(items, f) for items, f in batch if f.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        self._count(len(batch))
+        try:
+            results = self.batch_fn([x for items, _ in batch for x in items])
+        except BaseException as e:
+            for _, f in batch:
+                f.set_exception(e)
+            return
+        start = 0
+        for items, f in batch:
+            f.set_result(None if results is None else results[start:start + len(items)])
+            start += len(items)
@@ -0,0 +1,190 @@
+# diff_core.py — token diff and track changes shared by the apps, metrics and exports
+# Kept free of heavy imports (no torch/sacrebleu) so export worker processes start fast.
+# - edit_script(): one token diff per (baseline, student) pair, in SequenceMatcher
+#   opcode form. Patience anchors (tokens unique on both sides) split the texts into
+#   small gaps, each diffed with Myers' O(ND) algorithm in linear space. The result
+#   is memoised, so the Track Changes panel, the DOCX report and the edit counts in
+#   metrics_core.compute_edit_details all reuse the same pass.
+
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from typing import List, Tuple
+
+from docx import Document
+from docx.shared import RGBColor
+
+from text_core import analyze_text
+
+# ---------------- Token diff (patience + Myers) ----------------
+def _middle_snake(a, a0, a1, b, b0, b1):
+    """Myers' middle snake of a[a0:a1] vs b[b0:b1]: (x, y, u, v, d), offsets relative."""
+    n, m = a1 - a0, b1 - b0
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    off = max_d + 1
+    vf = [0] * (2 * max_d + 3)  # furthest x on each forward diagonal k = x - y
+    vb = [0] * (2 * max_d + 3)  # same, walking back from the ends
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[off + k - 1] < vf[off + k + 1]):
+                x = vf[off + k + 1]
+            else:
+                x = vf[off + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            vf[off + k] = x
+            if odd and -(d - 1) <= delta - k <= d - 1 and x + vb[off + delta - k] >= n:
+                return x0, y0, x, y, 2 * d - 1
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vb[off + k - 1] < vb[off + k + 1]):
+                x = vb[off + k + 1]
+            else:
+                x = vb[off + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a1 - 1 - x] == b[b1 - 1 - y]:
+                x += 1
+                y += 1
+            vb[off + k] = x
+            if not odd and -d <= delta - k <= d and x + vf[off + delta - k] >= n:
+                return n - x, m - y, n - x0, m - y0, 2 * d
+    raise AssertionError("unreachable")
+
+def _myers_blocks(a, a0, a1, b, b0, b1, out):
+    """Append matching blocks (i, j, size) of a[a0:a1] vs b[b0:b1] to out, in order."""
+    start = a0
+    while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+        a0 += 1
+        b0 += 1
+    if a0 > start:
+        out.append((start, b0 - (a0 - start), a0 - start))
+    tail = 0
+    while a1 > a0 and b1 > b0 and a[a1 - 1] == b[b1 - 1]:
+        a1 -= 1
+        b1 -= 1
+        tail += 1
+    if a0 < a1 and b0 < b1:  # both sides left and trimmed, so d >= 2 and both halves shrink
+        x, y, u, v, _ = _middle_snake(a, a0, a1, b, b0, b1)
+        _myers_blocks(a, a0, a0 + x, b, b0, b0 + y, out)
+        if u > x:
+            out.append((a0 + x, b0 + y, u - x))
+        _myers_blocks(a, a0 + u, a1, b, b0 + v, b1, out)
+    if tail:
+        out.append((a1, b1, tail))
+
+def _patience_anchors(a, b):
+    """(i, j) pairs of tokens occurring exactly once on each side, longest increasing run."""
+    seen_a, seen_b = {}, {}
+    for i, t in enumerate(a):
+        seen_a[t] = -1 if t in seen_a else i
+    for j, t in enumerate(b):
+        seen_b[t] = -1 if t in seen_b else j
+    pairs = [(i, seen_b[t]) for t, i in seen_a.items() if i >= 0 and seen_b.get(t, -1) >= 0]
+    pairs.sort()
+    tails, tail_idx, prev = [], [], [None] * len(pairs)  # patience sort on j
+    for p, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos:
+            prev[p] = tail_idx[pos - 1]
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(p)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = p
+    run = []
+    p = tail_idx[-1] if tail_idx else None
+    while p is not None:
+        run.append(pairs[p])
+        p = prev[p]
+    return run[::-1]
+
+def _matching_blocks(a, b):
+    blocks = []
+    i = j = 0
+    for ai, bj in _patience_anchors(a, b) + [(len(a), len(b))]:
+        _myers_blocks(a, i, ai, b, j, bj, blocks)
+        if ai < len(a):
+            blocks.append((ai, bj, 1))
+        i, j = ai + 1, bj + 1
+    merged = []
+    for i, j, size in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    return merged
+
+def token_opcodes(a_tokens: List[str], b_tokens: List[str]) -> List[Tuple[str, int, int, int, int]]:
+    """SequenceMatcher-style opcodes ("equal"/"replace"/"delete"/"insert") for two token lists."""
+    ids = {}
+    a = [ids.setdefault(t, len(ids)) for t in a_tokens]  # compare small ints, not strings
+    b = [ids.setdefault(t, len(ids)) for t in b_tokens]
+    ops = []
+    i = j = 0
+    for bi, bj, size in _matching_blocks(a, b) + [(len(a), len(b), 0)]:
+        if i < bi and j < bj:
+            ops.append(("replace", i, bi, j, bj))
+        elif i < bi:
+            ops.append(("delete", i, bi, j, bj))
+        elif j < bj:
+            ops.append(("insert", i, bi, j, bj))
+        if size:
+            ops.append(("equal", bi, bi + size, bj, bj + size))
+        i, j = bi + size, bj + size
+    return ops
+
+@lru_cache(maxsize=256)
+def edit_script(baseline: str, student_text: str):
+    """(baseline tokens, student tokens, opcodes), memoised per text pair. Treat as read-only."""
+    a, b = analyze_text(baseline).tokens, analyze_text(student_text).tokens
+    return a, b, tuple(token_opcodes(a, b))
+
+def _diff_tokens(baseline: str, student_text: str):
+    """Yield (tag, token) with tag in "-", "+", " "; a replace is its deletions, then its insertions."""
+    a, b, ops = edit_script(baseline, student_text)
+    for tag, i1, i2, j1, j2 in ops:
+        if tag == "equal":
+            for t in a[i1:i2]:
+                yield " ", t
+            continue
+        for t in a[i1:i2]:
+            yield "-", t
+        for t in b[j1:j2]:
+            yield "+", t
+
+# ---------------- Track Changes (HTML + DOCX) ----------------
+def _join_tokens_for_display(tokens: List[str]) -> str:
+    # Join tokens with spaces, then clean spaces before punctuation
+    out = " ".join(tokens)
+    out = re.sub(r"\s+([.,!?;:])", r"\1", out)
+    return out
+
+def diff_text(baseline: str, student_text: str) -> str:
+    parts = []
+    for tag, token in _diff_tokens(baseline, student_text):
+        if tag == "-":
+            parts.append(f"<span style='color:#c00;text-decoration:line-through'>{token}</span>")
+        elif tag == "+":
+            parts.append(f"<span style='color:#080'>{token}</span>")
+        else:
+            parts.append(token)
+    return _join_tokens_for_display(parts)
+
+def add_diff_to_doc(doc: Document, baseline: str, student_text: str):
+    p = doc.add_paragraph()
+    for tag, token in _diff_tokens(baseline, student_text):
+        if tag == "-":
+            run = p.add_run(token + " ")
+            run.font.strike = True
+            run.font.color.rgb = RGBColor(255, 0, 0)
+        elif tag == "+":
+            run = p.add_run(token + " ")
+            run.font.color.rgb = RGBColor(0, 128, 0)
+        else:
+            p.add_run(token + " ")
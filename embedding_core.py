@@ -0,0 +1,182 @@
+# embedding_core.py — CPU inference backends for the sentence-similarity model
+# EDUAPP_EMBED_BACKEND picks how metrics_core runs the sentence-transformer:
+# - "torch" (default): fp32 PyTorch, as before.
+# - "torch-int8": the same model with its Linear layers dynamically quantized to int8
+#   (no extra dependencies; smaller and faster on CPU).
+# - "onnx": ONNX Runtime on the model's ONNX export (needs sentence-transformers>=3.2,
+#   onnxruntime and optimum).
+# - "onnx-int8": ONNX Runtime on an int8-quantized export. The hub's
+#   onnx/model_qint8_<EDUAPP_EMBED_QUANT_CONFIG>.onnx is used if published (config:
+#   arm64, avx2, avx512 or avx512_vnni, default avx512_vnni), otherwise the model is
+#   quantized once into data/models/.
+# Embeddings from different backends differ slightly, so each backend has its own
+# embedding cache entries (vectors from a model server are keyed on the server's backend). Before switching, check the backend against fp32 on real
+# submissions:  python embedding_core.py check --backend onnx-int8 [--tol 0.02]
+# (max |difference| of SentenceCosine_Ref / SentenceCosine_Source, per-text encode
+# latency, and exit status 1 if any metric moves by more than --tol).
+
+import os
+import sys
+import time
+import argparse
+
+from storage_core import DATA_DIR
+from lazy_core import lazy_import
+
+SentenceTransformer = lazy_import("sentence_transformers", "SentenceTransformer")
+torch = lazy_import("torch")
+onnxruntime = lazy_import("onnxruntime")
+optimum = lazy_import("optimum")
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+MODEL_DIR = DATA_DIR / "models"
+
+def configured_backend() -> str:
+    return os.getenv("EDUAPP_EMBED_BACKEND", "torch").strip().lower() or "torch"
+
+def _quant_config() -> str:
+    return os.getenv("EDUAPP_EMBED_QUANT_CONFIG", "avx512_vnni")
+
+def _onnx(name_or_path: str, file_name: str | None = None):
+    if not (onnxruntime.available() and optimum.available()):
+        raise ImportError("the ONNX embedding backends need onnxruntime and optimum installed")
+    kwargs = {"file_name": file_name} if file_name else {}
+    return SentenceTransformer(name_or_path, device="cpu", backend="onnx", model_kwargs=kwargs)
+
+def _onnx_int8(name: str):
+    config = _quant_config()
+    file_name = f"onnx/model_qint8_{config}.onnx"
+    local = MODEL_DIR / name.replace("/", "__")
+    if (local / file_name).exists():
+        return _onnx(str(local), file_name)
+    try:
+        return _onnx(name, file_name)  # published on the hub
+    except ImportError:
+        raise
+    except Exception:
+        pass  # not published for this model: quantize it ourselves, once
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    model = _onnx(name)
+    model.save(str(local))
+    export_dynamic_quantized_onnx_model(model, config, str(local))
+    return _onnx(str(local), file_name)
+
+def build_sentence_model(name: str, backend: str | None = None):
+    """The sentence-transformer `name` on `backend` (default: EDUAPP_EMBED_BACKEND), or None without the library."""
+    backend = backend or configured_backend()
+    if backend not in BACKENDS:
+        raise ValueError(f"embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    if SentenceTransformer.get() is None:
+        return None
+    if backend == "torch":
+        return SentenceTransformer(name)
+    if backend == "torch-int8":
+        model = SentenceTransformer(name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if backend == "onnx":
+        return _onnx(name)
+    return _onnx_int8(name)
+
+# ---------------- Validation against fp32 ----------------
+SAMPLE_RECORDS = [  # used when there are no stored submissions to check on
+    {"source_text": "The committee approved the budget after a long debate.",
+     "reference": "وافقت اللجنة على الميزانية بعد نقاش طويل.",
+     "student_text": "أقرت اللجنة الميزانية بعد مناقشة طويلة."},
+    {"source_text": "Climate change threatens coastal cities around the world.",
+     "reference": "يهدد تغير المناخ المدن الساحلية في جميع أنحاء العالم.",
+     "student_text": "التغير المناخي يهدد المدن الساحلية حول العالم."},
+    {"source_text": "يجب على الطلاب تسليم الواجبات قبل نهاية الأسبوع.",
+     "reference": "Students must submit their assignments before the end of the week.",
+     "student_text": "The students have to hand in the homework before the weekend."},
+    {"source_text": "The new hospital will open its doors next spring.",
+     "reference": "سيفتح المستشفى الجديد أبوابه في الربيع المقبل.",
+     "student_text": "المستشفى الجديد سيفتح الربيع القادم."},
+    {"source_text": "ارتفعت أسعار المواد الغذائية بنسبة 12% هذا العام.",
+     "reference": "Food prices rose by 12% this year.",
+     "student_text": "This year food prices went up 12 percent."},
+]
+
+def stored_records(limit: int) -> list:
+    """Up to `limit` stored submissions as evaluate_batch records (texts + current reference)."""
+    from storage_core import EXERCISES_FILE, get_storage, load_json
+    from grading_core import _regrade_record
+    exercises = load_json(EXERCISES_FILE, readonly=True)
+    out = []
+    for _, ex_id, sub in get_storage().iter_submissions():
+        ex = exercises.get(ex_id)
+        if ex is not None and sub.get("student_text"):
+            out.append(_regrade_record(ex, sub))
+            if len(out) >= limit:
+                break
+    return out
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+def _cosines(model, records):
+    """(SentenceCosine_Ref, SentenceCosine_Source) per record, as evaluate_batch rounds them, and encode seconds per text."""
+    from metrics_core import _cosine, _r
+    texts = list(dict.fromkeys(t for r in records for t in (r["student_text"], r.get("reference"), r.get("source_text")) if t))
+    embs = {}
+    start = time.perf_counter()
+    for t in texts:  # one text at a time, like a single submit
+        embs[t] = model.encode([t], normalize_embeddings=False)[0]
+    per_text = (time.perf_counter() - start) / max(1, len(texts))
+    out = []
+    for r in records:
+        ref = _cosine(embs[r["student_text"]], embs[r["reference"]]) if r.get("reference") else None
+        src = _cosine(embs[r["student_text"]], embs[r["source_text"]]) if r.get("source_text") else None
+        out.append((_r(ref, 3), _r(src, 3)))
+    return out, per_text
+
+def check_backend(backend: str, records, tol: float = 0.02, name: str | None = None) -> dict:
+    """Compare `backend` with fp32 torch on records: max/mean |difference| per metric, latency and memory."""
+    from metrics_core import _st_model_name
+    name = name or _st_model_name
+    report = {"backend": backend, "records": len(records), "tolerance": tol}
+    runs = {}
+    for b in (backend, "torch"):  # the candidate first, so its memory growth isn't hidden by fp32's
+        before = _rss_mb()
+        model = build_sentence_model(name, b)
+        if model is None:
+            raise ImportError("sentence-transformers is not installed")
+        grew = _rss_mb() - before
+        runs[b] = _cosines(model, records) + (grew,)
+        del model
+    (cand, cand_sec, cand_mb), (ref, ref_sec, ref_mb) = runs[backend], runs["torch"]
+    for i, metric in enumerate(("SentenceCosine_Ref", "SentenceCosine_Source")):
+        diffs = [abs(c[i] - f[i]) for c, f in zip(cand, ref) if c[i] is not None and f[i] is not None]
+        report[metric] = {"pairs": len(diffs), "max_abs_diff": round(max(diffs, default=0.0), 4),
+                          "mean_abs_diff": round(sum(diffs) / len(diffs), 4) if diffs else None,
+                          "over_tolerance": sum(d > tol for d in diffs)}
+    report["ms_per_text"] = {backend: round(cand_sec * 1000, 2), "torch": round(ref_sec * 1000, 2)}
+    report["model_mb"] = {backend: round(cand_mb, 1), "torch": round(ref_mb, 1)}
+    report["ok"] = all(report[m]["over_tolerance"] == 0 for m in ("SentenceCosine_Ref", "SentenceCosine_Source"))
+    return report
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="EduApp sentence-embedding backends")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ck = sub.add_parser("check", help="compare a backend's sentence cosines with fp32 torch")
+    ck.add_argument("--backend", default=None, choices=BACKENDS, help="default: EDUAPP_EMBED_BACKEND")
+    ck.add_argument("--tol", type=float, default=0.02, help="max allowed |difference| per cosine")
+    ck.add_argument("--limit", type=int, default=200, help="stored submissions to check on")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "check":
+        records = stored_records(args.limit) or SAMPLE_RECORDS
+        report = check_backend(args.backend or configured_backend(), records, args.tol)
+        for metric in ("SentenceCosine_Ref", "SentenceCosine_Source"):
+            m = report[metric]
+            print(f"{metric:<22} max |diff| {m['max_abs_diff']:.4f}  mean {m['mean_abs_diff']}  "
+                  f"over {args.tol}: {m['over_tolerance']}/{m['pairs']}")
+        print(f"encode ms per text: {report['ms_per_text']}; model MB: {report['model_mb']}")
+        print("OK" if report["ok"] else "FAILED: outside tolerance")
+        sys.exit(0 if report["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
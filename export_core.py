@@ -0,0 +1,279 @@
+# export_core.py — class-wide exports shared by main.py and translation_lab.py
+# - Metrics summary is streamed row by row from storage.iter_submissions():
+#   xlsx via openpyxl's write-only mode, plain CSV, or Parquet (pyarrow, optional)
+#   written in row groups, into a temp file the apps hand to st.download_button.
+#   Building it never holds the whole class in memory; Streamlit itself still reads
+#   the finished file into memory to serve it.
+# - deferred(): the file is only built when the download button is clicked (instead
+#   of on every rerun of the instructor page). This needs download_button(data=callable),
+#   i.e. Streamlit >= 1.52 as pinned in requirements.txt; older versions build it upfront.
+# - cached_export(): DOCX (or any) export bytes are kept in a process-wide LRU keyed
+#   on a content hash of their inputs, so an unchanged exercise/student report is
+#   built once and reused until its data changes (EDUAPP_EXPORT_CACHE_MB, default 64).
+# - export_class_zip(): every student's Word report, built on a process pool
+#   (EDUAPP_EXPORT_WORKERS, default: CPU count) and streamed into a ZIP file one
+#   document at a time. Also available headless: `python export_core.py class-zip`.
+
+import io
+import os
+import re
+import csv
+import json
+import zipfile
+import hashlib
+import argparse
+import threading
+import multiprocessing
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from importlib.metadata import version, PackageNotFoundError
+
+from docx import Document
+
+from storage_core import get_storage, resolve_text
+from diff_core import add_diff_to_doc
+from lazy_core import lazy_import
+
+Workbook = lazy_import("openpyxl", "Workbook")  # imported when an xlsx export is written
+pa = lazy_import("pyarrow")  # optional, imported when a Parquet export is written
+pq = lazy_import("pyarrow.parquet")
+
+# ---------------- Summary rows ----------------
+SUMMARY_COLUMNS = [
+    "Student", "Exercise", "Task Type", "Length Ratio", "BLEU", "chrF++", "BERTScore_F1",
+    "SentenceCosine_Ref", "SentenceCosine_Source", "Additions", "Deletions", "Edits",
+    "Time Spent (s)", "Characters Typed",
+]
+_METRIC_KEYS = {
+    "Length Ratio": "length_ratio", "BLEU": "BLEU", "chrF++": "chrF++", "BERTScore_F1": "BERTScore_F1",
+    "SentenceCosine_Ref": "SentenceCosine_Ref", "SentenceCosine_Source": "SentenceCosine_Source",
+    "Additions": "additions", "Deletions": "deletions", "Edits": "edits",
+}
+_TEXT_COLUMNS = {"Student", "Exercise", "Task Type"}
+
+def summary_rows(records, columns=SUMMARY_COLUMNS):
+    """records: iterable of (student, ex_id, submission). Yields one list per row, lazily."""
+    for student, ex_id, sub in records:
+        m = sub.get("metrics", {})
+        row = []
+        for col in columns:
+            if col == "Student":
+                row.append(student)
+            elif col == "Exercise":
+                row.append(ex_id)
+            elif col == "Task Type":
+                row.append(sub.get("task_type", ""))
+            elif col == "Time Spent (s)":
+                row.append(sub.get("time_spent_sec", 0))
+            elif col == "Characters Typed":
+                row.append(sub.get("keystrokes", 0))
+            else:
+                row.append(m.get(_METRIC_KEYS[col]))
+        yield row
+
+# ---------------- Writers ----------------
+def _write_xlsx(rows, columns, out):
+    wb = Workbook(write_only=True)  # rows go straight to a temp file, not an in-memory sheet
+    ws = wb.create_sheet("Sheet1")
+    ws.append(columns)
+    for row in rows:
+        ws.append(row)
+    wb.save(out)
+
+def _write_csv(rows, columns, out):
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")  # BOM so Excel reads UTF-8
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    writer.writerows(rows)
+    text.flush()
+    text.detach()
+
+def _write_parquet(rows, columns, out, chunk_rows=5000):
+    schema = pa.schema([(c, pa.string() if c in _TEXT_COLUMNS else pa.float64()) for c in columns])
+    with pq.ParquetWriter(out, schema) as writer:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                writer.write_table(_parquet_table(chunk, columns, schema))
+                chunk = []
+        if chunk:
+            writer.write_table(_parquet_table(chunk, columns, schema))
+
+def _parquet_table(chunk, columns, schema):
+    cols = list(zip(*chunk)) if chunk else [[] for _ in columns]
+    arrays = [pa.array([None if v is None else (str(v) if c in _TEXT_COLUMNS else float(v)) for v in vals],
+                       type=schema.field(c).type)
+              for c, vals in zip(columns, cols)]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+_WRITERS = {"xlsx": _write_xlsx, "csv": _write_csv, "parquet": _write_parquet}
+
+# label -> (extension, mime); Parquet only when pyarrow is installed
+SUMMARY_FORMATS = {
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV": ("csv", "text/csv"),
+}
+if pq.available():
+    SUMMARY_FORMATS["Parquet"] = ("parquet", "application/vnd.apache.parquet")
+
+def write_summary(records, out, fmt="xlsx", columns=SUMMARY_COLUMNS):
+    """Stream the metrics summary of `records` into the binary file object `out`."""
+    _WRITERS[fmt](summary_rows(records, columns), list(columns), out)
+
+# ---------------- Streamlit download helper ----------------
+def _streamlit_version():
+    try:
+        return tuple(int(x) for x in version("streamlit").split(".")[:2])
+    except (PackageNotFoundError, ValueError):
+        return (0, 0)
+
+DEFERRED_DOWNLOADS = _streamlit_version() >= (1, 52)  # download_button(data=callable)
+
+def deferred(build):
+    """data= for st.download_button: build() on click where supported, else right now."""
+    return build if DEFERRED_DOWNLOADS else build()
+
+# ---------------- Export cache (content-addressed) ----------------
+_export_cache = OrderedDict()  # key -> bytes, most recently used last
+_export_cache_bytes = 0
+_export_cache_max = int(float(os.getenv("EDUAPP_EXPORT_CACHE_MB", "64")) * 1024 * 1024)
+_export_lock = threading.Lock()
+
+def content_key(kind: str, *parts) -> str:
+    """Hash of everything an export is built from; any change gives a new key."""
+    raw = json.dumps([kind, parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def cached_export(key: str, build, *args) -> bytes:
+    """Bytes of build(*args) (BytesIO or bytes), built once per key."""
+    global _export_cache_bytes
+    with _export_lock:
+        data = _export_cache.get(key)
+        if data is not None:
+            _export_cache.move_to_end(key)
+            return data
+    data = build(*args)
+    data = data.getvalue() if hasattr(data, "getvalue") else bytes(data)
+    with _export_lock:
+        if key not in _export_cache:
+            _export_cache[key] = data
+            _export_cache_bytes += len(data)
+        while _export_cache_bytes > _export_cache_max and len(_export_cache) > 1:
+            _, old = _export_cache.popitem(last=False)
+            _export_cache_bytes -= len(old)
+    return data
+
+# ---------------- Word reports ----------------
+def student_report(student_name, subs, reflection=False):
+    """One student's submissions as a DOCX (BytesIO); reflection=True adds the reflection field."""
+    doc = Document()
+    doc.add_heading(f"Student: {student_name}", 0)
+    for ex_id, sub in subs.items():
+        doc.add_heading(f"Exercise {ex_id}", level=1)
+        doc.add_paragraph("Source Text:")
+        mt = resolve_text(sub, "mt_text")  # texts may be blob refs; resolved on demand
+        doc.add_paragraph(resolve_text(sub, "source_text") or "")
+        if mt:
+            doc.add_paragraph("MT Output:")
+            doc.add_paragraph(mt)
+
+        if sub.get("task_type") == "Post-edit MT":
+            doc.add_paragraph("Student Submission (Track Changes):")
+            base = mt or ""
+            add_diff_to_doc(doc, base, sub.get("student_text", ""))
+        else:
+            doc.add_paragraph("Student Submission:")
+            doc.add_paragraph(sub.get("student_text", ""))
+
+        metrics = sub.get("metrics", {})
+        doc.add_paragraph(f"Metrics: {metrics}")
+        doc.add_paragraph(f"Task Type: {sub.get('task_type','')}")
+        doc.add_paragraph(f"Time Spent: {sub.get('time_spent_sec', 0):.2f} sec")
+        doc.add_paragraph(f"Characters (not keystrokes): {sub.get('keystrokes', 0)}")
+        if reflection and sub.get("reflection"):
+            doc.add_paragraph("Reflection:")
+            doc.add_paragraph(sub.get("reflection"))
+        doc.add_paragraph("---")
+
+    buf = BytesIO()
+    doc.save(buf)
+    buf.seek(0)
+    return buf
+
+def _report_bytes(student_name, subs, reflection):
+    """Worker side of export_class_zip."""
+    return student_name, student_report(student_name, subs, reflection).getvalue()
+
+# ---------------- Whole-class ZIP ----------------
+def _export_workers() -> int:
+    return max(1, int(os.getenv("EDUAPP_EXPORT_WORKERS", "0")) or os.cpu_count() or 1)
+
+def class_records(storage=None):
+    """(student, submissions) pairs, one student loaded at a time."""
+    storage = storage or get_storage()
+    for student in storage.students():
+        yield student, storage.student_submissions(student)
+
+def export_class_zip(students, out, reflection=False, workers=None, progress=None):
+    """
+    Write one "<student>_submissions.docx" per (student, submissions) pair into a
+    ZIP on the binary file object `out`. Reports are built on a process pool and
+    written as soon as each one is done; at most two per worker are held in memory.
+    progress(done_count) is called after each document. Returns the number written.
+    """
+    workers = workers or _export_workers()
+    names = set()
+    done = 0
+
+    def _entry(student):
+        base = re.sub(r"[^\w\-]+", "_", student) + "_submissions"
+        name, n = base, 1
+        while name in names:  # two names that sanitise alike
+            n += 1
+            name = f"{base}_{n}"
+        names.add(name)
+        return name + ".docx"
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool, \
+            zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as zf:  # .docx is already deflated
+        pending = set()
+
+        def _drain(block):
+            nonlocal done
+            finished = wait(pending, return_when=FIRST_COMPLETED)[0] if block else {f for f in pending if f.done()}
+            for fut in finished:
+                pending.discard(fut)
+                student, data = fut.result()
+                zf.writestr(_entry(student), data)
+                done += 1
+                if progress:
+                    progress(done)
+
+        for student, subs in students:
+            pending.add(pool.submit(_report_bytes, student, subs, reflection))
+            while len(pending) >= workers * 2:
+                _drain(block=True)
+            _drain(block=False)
+        while pending:
+            _drain(block=True)
+    return done
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="EduApp exports")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    cz = sub.add_parser("class-zip", help="every student's Word report in one ZIP")
+    cz.add_argument("--out", default="class_submissions.zip")
+    cz.add_argument("--workers", type=int, default=None, help="worker processes (default: EDUAPP_EXPORT_WORKERS or CPU count)")
+    cz.add_argument("--reflection", action="store_true", help="include student reflections (main.py data)")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "class-zip":
+        with open(args.out, "wb") as f:
+            n = export_class_zip(class_records(), f, reflection=args.reflection, workers=args.workers)
+        print(f"{n} student report(s) written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,11 @@
 from dataclasses import dataclass
 from typing import List, Dict, Tuple, Optional
 import re
+import html
+from functools import lru_cache
+
+from text_core import AnalyzedText, analyze_text, DIGIT_TABLE
+from lexicon_core import PhraseMatcher, Lexicon, LexiconStore, LEXICON_DIR
 
 @dataclass
 class Issue:
@@ -13,12 +18,7 @@ class Issue:
     prefer: Optional[str] = None
     example: Optional[str] = None
 
-AR_DIGITS="٠١٢٣٤٥٦٧٨٩"; FA_DIGITS="۰۱۲۳۴۵۶۷۸۹"; EN="0123456789"
-DIGIT_TABLE = str.maketrans({**{a:b for a,b in zip(AR_DIGITS, EN)}, **{a:b for a,b in zip(FA_DIGITS, EN)}})
 def _normalize_digits(s:str)->str: return (s or "").translate(DIGIT_TABLE)
-def _find_span(raw:str, phrase:str):
-    i=(raw or "").lower().find((phrase or "").lower()); return (i,i+len(phrase)) if i>=0 else None
-def _norm_ar(s:str)->str: return (s or "").replace("أ","ا").replace("إ","ا").replace("آ","ا").replace("ى","ي").replace("ة","ه")
 def _direction(pe:str)->str: return "EN->AR" if re.search(r"[\u0600-\u06FF]", pe or "") else "AR->EN"
 
 # small, safe lexicons (expand later)
@@ -28,38 +28,63 @@ AR_PREP={"مسؤول":"عن","مهتم":"ب","قادر":"على","ملتزم":"
 IDIOMS_EN2AR={"rule of thumb":"قاعدة عامة تقريبية","add fuel to the fire":"يصبّ الزيت على النار"}
 IDIOMS_AR2EN={"ذهب أدراج الرياح":"came to nothing","بين ليلة وضحاها":"overnight"}
 
-def _detect_accuracy(src:str, pe:str)->List[Issue]:
-    out=[]; pat=r"\d+[.,]?\d*"
-    s=[x.strip(".,") for x in re.findall(pat,_normalize_digits(src or ""))]
-    p=[x.strip(".,") for x in re.findall(pat,_normalize_digits(pe or ""))]
+# ---------- lexicons (files in data/lexicons/ override the tables above, see lexicon_core.py) ----------
+DEFAULT_LEXICONS={"en_collo":EN_COLLO, "ar_collo":AR_COLLO, "ar_prep":AR_PREP, "idioms_en2ar":IDIOMS_EN2AR, "idioms_ar2en":IDIOMS_AR2EN}
+_store=None
+def get_lexicons()->LexiconStore:
+    """The process-wide lexicon handle (hot-reloaded from LEXICON_DIR)."""
+    global _store
+    if _store is None: _store=LexiconStore(LEXICON_DIR, DEFAULT_LEXICONS)
+    return _store
+
+@lru_cache(maxsize=32)
+def _terminology_matcher(items:tuple)->PhraseMatcher: return PhraseMatcher([wrong.lower() for wrong,_ in items])
+
+_next_word=re.compile(r"\s+(\S+)")
+def _isword(c:str)->bool: return c.isalnum() or c=="_"
+def _at_boundary(raw:str, i:int)->bool:  # regex \b
+    return (i>0 and _isword(raw[i-1])) != (i<len(raw) and _isword(raw[i]))
+
+def _per_entry(hits, n):
+    """(start, end, entry) hits -> non-overlapping hits grouped by entry, in lexicon order."""
+    by_entry=[[] for _ in range(n)]
+    for s,e,k in hits:
+        if not by_entry[k] or by_entry[k][-1][1]<=s: by_entry[k].append((s,e))
+    return [(k,s,e) for k in range(n) for s,e in by_entry[k]]
+
+def _detect_accuracy(src:AnalyzedText, pe:AnalyzedText)->List[Issue]:
+    out=[]
+    s=list(src.normalized_numbers); p=list(pe.normalized_numbers)
     if sorted(s)!=sorted(p): out.append(Issue("Accuracy","major",f"Numbers differ: src={s} pe={p}",None))
-    if src and pe:
-        ratio=len(pe.split())/max(1,len(src.split()))
+    if src.text and pe.text:
+        ratio=pe.whitespace_words/max(1,src.whitespace_words)
         if ratio<0.9: out.append(Issue("Accuracy","major","Possible under-translation.",None))
         elif ratio>1.1: out.append(Issue("Accuracy","minor","Possible over-translation.",None))
     return out
 
-def _detect_fluency(pe:str)->List[Issue]:
-    out=[]
-    for m in re.finditer(r"\s+([.,;:!?])", pe or ""): out.append(Issue("Fluency","minor","Unnatural space before punctuation.",m.span(), (pe or "")[m.start():m.end()], None, "Remove the extra space."))
-    for m in re.finditer(r",(?=\S)", pe or ""): out.append(Issue("Fluency","minor","Missing space after comma.",m.span(), (pe or "")[m.start():m.end()], None, "Insert a space after the comma."))
+def _detect_fluency(pe:AnalyzedText)->List[Issue]:
+    out=[]; raw=pe.text
+    for m in re.finditer(r"\s+([.,;:!?])", raw): out.append(Issue("Fluency","minor","Unnatural space before punctuation.",m.span(), raw[m.start():m.end()], None, "Remove the extra space."))
+    for m in re.finditer(r",(?=\S)", raw): out.append(Issue("Fluency","minor","Missing space after comma.",m.span(), raw[m.start():m.end()], None, "Insert a space after the comma."))
     return out
 
-def _detect_terminology(pe:str, synonyms:Dict[str,str])->List[Issue]:
-    out=[]; 
-    for wrong,right in (synonyms or {}).items():
-        for m in re.finditer(rf"\b{re.escape(wrong)}\b", pe or "", flags=re.IGNORECASE):
-            out.append(Issue("Terminology","minor",f"Prefer '{right}' over '{wrong}'.",m.span(), (pe or "")[m.start():m.end()], right, f"Use '{right}' consistently."))
+def _detect_terminology(pe:AnalyzedText, synonyms:Dict[str,str])->List[Issue]:
+    out=[]; raw=pe.text
+    if not synonyms: return out
+    items=tuple(synonyms.items()); matcher=_terminology_matcher(items)
+    hits=((s,e,k) for s,e,k in matcher.finditer(pe.lower) if _at_boundary(raw,s) and _at_boundary(raw,e))
+    for k,s,e in _per_entry(hits, len(items)):
+        wrong,right=items[k]
+        out.append(Issue("Terminology","minor",f"Prefer '{right}' over '{wrong}'.",(s,e), raw[s:e], right, f"Use '{right}' consistently."))
     return out
 
-def _detect_collocations_en(pe:str)->List[Issue]:
-    out=[]; raw=pe or ""; text=raw.lower()
-    for prefer,bads in EN_COLLO.items():
-        for bad in bads:
-            b=bad.rstrip("*")
-            if b in text:
-                sev="minor" if bad.endswith("*") else "major"
-                out.append(Issue("Collocations",sev,f"Prefer '{prefer}' over '{b}'.", _find_span(raw,b), b, prefer, f"We {prefer} yesterday."))
+def _detect_collocations_en(pe:AnalyzedText, lex:Lexicon)->List[Issue]:
+    out=[]; raw=pe.text
+    entries, matcher = lex.matcher("en_collo")
+    for k,span in sorted(matcher.first(pe.lower).items()):  # lexicon order
+        prefer,bad=entries[k]; b=bad.rstrip("*")
+        sev="minor" if bad.endswith("*") else "major"
+        out.append(Issue("Collocations",sev,f"Prefer '{prefer}' over '{b}'.", span, b, prefer, f"We {prefer} yesterday."))
     rules=[(r"\bdo (a|an|the) ([a-z]+?ion)\b", r"make \1 \2"), (r"\bgive attention\b","pay attention"),
            (r"\bdo an? (analysis|study|review)\b", r"conduct \1"), (r"\bdo a research\b","conduct research")]
     for pat,repl in rules:
@@ -68,42 +93,73 @@ def _detect_collocations_en(pe:str)->List[Issue]:
             out.append(Issue("Collocations","major",f"Prefer '{re.sub(pat,repl,bad,flags=re.IGNORECASE)}' over '{bad}'.", m.span(), bad, re.sub(pat,repl,bad,flags=re.IGNORECASE), f"Example: We {re.sub(pat,repl,bad,flags=re.IGNORECASE)}."))
     return out
 
-def _detect_collocations_ar(pe:str)->List[Issue]:
-    out=[]; raw=pe or ""; raw_n=_norm_ar(raw)
-    for prefer,bads in AR_COLLO.items():
-        for bad in bads:
-            i=raw_n.find(_norm_ar(bad))
-            if i>=0: out.append(Issue("Collocations","major",f"الأفضل '{prefer}' بدل '{bad}'.",(i,i+len(bad)), bad, prefer, f"مثال: {prefer} فورًا."))
-    for lemma,prep in AR_PREP.items():
-        for m in re.finditer(rf"{lemma}\s+(?!{prep})\S+", raw):
-            if prep not in m.group(0): out.append(Issue("Collocations","major",f"تستعمل '{lemma}' مع '{prep}'.", m.span(), raw[m.start():m.end()], f"{lemma} {prep}", f"مثال: {lemma} {prep} المشروع."))
+def _detect_collocations_ar(pe:AnalyzedText, lex:Lexicon)->List[Issue]:
+    out=[]; raw=pe.text
+    entries, matcher = lex.matcher("ar_collo")
+    for k,span in sorted(matcher.first(pe.ar_normalized).items()):  # lexicon order
+        prefer,bad=entries[k]
+        out.append(Issue("Collocations","major",f"الأفضل '{prefer}' بدل '{bad}'.",span, bad, prefer, f"مثال: {prefer} فورًا."))
+    lemmas, matcher = lex.matcher("ar_prep")
+    hits=[]
+    for s,e,k in matcher.finditer(raw):  # lemma, then the next word unless it starts with the preposition
+        prep=lemmas[k][1]; m=_next_word.match(raw,e)
+        if m and not m.group(1).startswith(prep) and prep not in raw[s:m.end()]: hits.append((s,m.end(),k))
+    for k,s,e in _per_entry(hits, len(lemmas)):
+        lemma,prep=lemmas[k]
+        out.append(Issue("Collocations","major",f"تستعمل '{lemma}' مع '{prep}'.", (s,e), raw[s:e], f"{lemma} {prep}", f"مثال: {lemma} {prep} المشروع."))
     return out
 
-def _detect_idioms(pe:str, direction:str)->List[Issue]:
-    out=[]; bank = IDIOMS_AR2EN if direction=="AR->EN" else IDIOMS_EN2AR
-    for lit,pref in bank.items():
-        i=(pe or "").lower().find(lit.lower())
-        if i>=0: out.append(Issue("Idioms","minor", ("Prefer" if direction=="AR->EN" else "جرّب")+f" '{pref}' بدل/over '{lit}'.", (i,i+len(lit)), lit, pref, "Use the idiomatic equivalent."))
+def _detect_idioms(pe:AnalyzedText, direction:str, lex:Lexicon)->List[Issue]:
+    out=[]
+    entries, matcher = lex.matcher("idioms_ar2en" if direction=="AR->EN" else "idioms_en2ar")
+    for k,span in sorted(matcher.first(pe.lower).items()):  # lexicon order
+        lit,pref=entries[k]
+        out.append(Issue("Idioms","minor", ("Prefer" if direction=="AR->EN" else "جرّب")+f" '{pref}' بدل/over '{lit}'.", span, lit, pref, "Use the idiomatic equivalent."))
     return out
 
 # ---------- public API ----------
-def analyze(src:str, pe:str, synonyms:Dict[str,str]|None=None, direction_hint:str|None=None):
+def analyze(src:str, pe:str, synonyms:Dict[str,str]|None=None, direction_hint:str|None=None,
+            lexicon:Lexicon|LexiconStore|None=None):
+    """lexicon: a Lexicon or LexiconStore handle; default get_lexicons()."""
     direction = direction_hint or _direction(pe)
+    src, pe = analyze_text(src), analyze_text(pe)  # shared with metrics/hints/diff, see text_core.py
+    lex = (lexicon or get_lexicons()).current()
     issues=[]
     issues += _detect_accuracy(src, pe)
     issues += _detect_fluency(pe)
     issues += _detect_terminology(pe, synonyms or {})
-    issues += _detect_collocations_en(pe) if direction=="AR->EN" else _detect_collocations_ar(pe)
-    issues += _detect_idioms(pe, "AR->EN" if direction=="AR->EN" else "EN->AR")
+    issues += _detect_collocations_en(pe, lex) if direction=="AR->EN" else _detect_collocations_ar(pe, lex)
+    issues += _detect_idioms(pe, "AR->EN" if direction=="AR->EN" else "EN->AR", lex)
     return issues, direction
 
 def render_highlights(text:str, issues:List[Issue])->str:
+    """
+    Issue spans as <mark>s over the HTML-escaped text, in one sweep over the sorted span
+    boundaries. Overlapping spans nest; a span that crosses the end of another is closed
+    and reopened around it, so the markup stays well-formed. Duplicate spans render once.
+    """
     COLORS={"Accuracy":"#c0392b","Fluency":"#f39c12","Terminology":"#8e44ad","Collocations":"#16a085","Idioms":"#2980b9","Formatting":"#7f8c8d"}
-    out=text or ""; spans=[(i.span[0],i.span[1],i.cat) for i in issues if i.span]; spans.sort(key=lambda x:x[0], reverse=True)
-    for s,e,cat in spans:
-        s=max(0,min(s,len(out))); e=max(s,min(e,len(out)))
-        color=COLORS.get(cat,"#555"); out=out[:s]+f'<mark style="background:{color}22;border-bottom:2px solid {color}">{out[s:e]}</mark>'+out[e:]
-    return f'<div style="font-family: ui-sans-serif; line-height:1.75; font-size:1rem'>{out}</div>'
+    raw=text or ""; n=len(raw)
+    spans=set()
+    for i in issues:
+        if not i.span: continue
+        s=max(0,min(i.span[0],n)); e=max(s,min(i.span[1],n))
+        if e>s: spans.add((s,e,i.cat))
+    spans=sorted(spans, key=lambda x:(x[0],-x[1],x[2]))  # outer (longer) spans open first
+    def _open(cat):
+        color=COLORS.get(cat,"#555"); return f'<mark style="background:{color}22;border-bottom:2px solid {color}">'
+    out=[]; stack=[]; pos=0; k=0
+    for b in sorted({p for s,e,_ in spans for p in (s,e)}):
+        out.append(html.escape(raw[pos:b])); pos=b
+        low=next((d for d,sp in enumerate(stack) if sp[1]==b), None)
+        if low is not None:  # close down to the lowest span ending here, reopen the rest
+            reopen=[sp for sp in stack[low:] if sp[1]!=b]
+            out.append("</mark>"*(len(stack)-low)); del stack[low:]
+            for sp in reopen: out.append(_open(sp[2])); stack.append(sp)
+        while k<len(spans) and spans[k][0]==b:
+            out.append(_open(spans[k][2])); stack.append(spans[k]); k+=1
+    out.append(html.escape(raw[pos:]))
+    return f'<div style="font-family: ui-sans-serif; line-height:1.75; font-size:1rem">{"".join(out)}</div>'
 
 # --- replace the whole teacher_overview() with this ---
 def teacher_overview(issues, *, lang="en", tone="supportive"):
@@ -0,0 +1,478 @@
+# grading_core.py — background scoring for the Submit button
+# A submit stores the record right away with status "pending" and returns; the
+# metrics (BLEU/chrF/BERTScore/...) are computed on a small worker pool and written
+# back into the stored record ("graded", or "failed" with empty metrics).
+# - Pool size: EDUAPP_GRADING_WORKERS (default 2)
+# - EDUAPP_GRADING_MODE=thread (default) runs the metrics on threads of the Streamlit
+#   process; =process runs them in a pool of worker processes (spawned, so no GIL
+#   contention with the UI), each loading the BERTScore/embedding models once.
+#   evaluate and its inputs must then be picklable (a module-level function such
+#   as metrics_core.evaluate_translation). If the process pool can't be used, the
+#   job is scored in-thread instead.
+# - warm_up(models=...) loads the models the app scores with before the first submit; progress and readiness are
+#   reported by warmup_core.status() and its optional /readyz probe.
+# - Each record carries the job_id that produced it; a result is only written if the
+#   stored record still has that job_id, so a resubmission is never overwritten by
+#   an older, slower job.
+# - A pending record is leased to the process that queued it ("owner", "lease_until",
+#   renewed while the job waits or runs; EDUAPP_GRADING_LEASE_SEC, default 120).
+#   resume_pending() only takes over records of its own app ("app") whose lease ran
+#   out, i.e. whose process died mid-job, so replicas never grade each other's live
+#   jobs. Points are awarded once per job_id ("points_job"), whoever grades it.
+# - `python grading_core.py regrade` re-scores every stored submission without a
+#   browser (e.g. after an exercise gets a reference_text), see regrade().
+
+import os
+import sys
+import json
+import time
+import uuid
+import pickle
+import socket
+import argparse
+import threading
+import multiprocessing
+from pathlib import Path
+from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from storage_core import DATA_DIR, EXERCISES_FILE, get_storage, load_json, resolve_text
+
+_pool = None
+_procs = None
+_pool_lock = threading.Lock()
+_jobs = {}  # job_id -> Future of a queued/running job (this process only)
+_leases = {}  # job_id -> (student, ex_id) of the jobs this process has queued or is running
+_lease_thread = None
+_resume_args = None  # (evaluate, points, inputs_for, app) once resume_pending() has run
+_warmed = False
+_warm_models = None  # warm_up(models=): loaded in each grading worker
+
+def _workers() -> int:
+    return max(1, int(os.getenv("EDUAPP_GRADING_WORKERS", "2")))
+
+def _lease_sec() -> float:
+    return max(10.0, float(os.getenv("EDUAPP_GRADING_LEASE_SEC", "120")))
+
+def _process_mode() -> bool:
+    return os.getenv("EDUAPP_GRADING_MODE", "thread").lower() == "process"
+
+def _executor() -> ThreadPoolExecutor:
+    """Threads that run a job end to end (in process mode they just wait on a worker)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix="grading")
+        return _pool
+
+# ---------------- Worker processes ----------------
+def _init_worker(models=None):
+    """Runs once in each worker process: load the models up front (one attempt each)."""
+    from warmup_core import load_all, select
+    select(models)
+    load_all(retries=1)
+
+def _ready():
+    """Worker warm-up report for warmup_core.status(); later loads retry on demand."""
+    from warmup_core import model_states
+    return {"pid": os.getpid(), "models": model_states(), "error": None}
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _procs
+    with _pool_lock:
+        if _procs is None:
+            ctx = multiprocessing.get_context("spawn")  # never fork a threaded server
+            _procs = ProcessPoolExecutor(max_workers=_workers(), mp_context=ctx,
+                                         initializer=_init_worker, initargs=(_warm_models,))
+        return _procs
+
+def _evaluate(evaluate, inputs):
+    global _procs
+    if _process_mode():
+        try:
+            return _process_pool().submit(evaluate, **inputs).result()
+        except BrokenProcessPool:
+            with _pool_lock:
+                _procs = None  # a worker died (e.g. OOM); start a fresh pool next time
+        except (pickle.PicklingError, AttributeError, TypeError):
+            pass  # unpicklable job: score it here rather than lose it
+    return evaluate(**inputs)
+
+def warm_up(models=None):
+    """
+    Load the models the app scores with ("bertscore", "sentence"; None: both) before
+    the first submit: in this process, or in every worker process.
+    """
+    global _warmed, _warm_models
+    if _warmed:
+        return
+    _warmed = True
+    _warm_models = None if models is None else tuple(models)
+    import warmup_core
+    warmup_core.select(_warm_models)  # what status() reports on, in either mode
+    if _process_mode():
+        pool = _process_pool()
+        warmup_core.track_workers([pool.submit(_ready) for _ in range(_workers())])
+        warmup_core.serve_probe()
+    else:
+        warmup_core.start(_warm_models)  # background load with retries, readiness probe
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+def owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def pending_fields(job_id: str, app: str) -> dict:
+    """The fields of a new submission that is waiting for job_id, leased to this process."""
+    return {"status": "pending", "job_id": job_id, "app": app,
+            "owner": owner_id(), "lease_until": time.time() + _lease_sec()}
+
+def record_app(sub: dict) -> str:
+    """The app that created a stored submission ("main" or "translation_lab"); records
+    from before the tag are told apart by main.py's reflection field."""
+    return sub.get("app") or ("main" if "reflection" in sub else "translation_lab")
+
+def _grade(student, ex_id, job_id, inputs, evaluate, points):
+    try:
+        try:
+            metrics, status = _evaluate(evaluate, inputs), "graded"
+        except Exception:
+            metrics, status = {}, "failed"
+        me = owner_id()
+        award = []
+
+        def _store(sub):
+            award.clear()  # update_submission may re-run us on newer data
+            if sub is None or sub.get("job_id") != job_id:
+                return None  # resubmitted meanwhile; the newer job owns the record
+            if sub.get("owner", me) != me:
+                return None  # our lease ran out and another process took the job over
+            sub["metrics"] = metrics
+            sub["status"] = status
+            sub.pop("lease_until", None)
+            if status == "graded" and sub.get("points_job") != job_id:
+                sub["points_job"] = job_id
+                award.append(True)
+            return sub
+
+        get_storage().update_submission(student, ex_id, _store)
+        if award and points is not None:
+            get_storage().add_points(student, points(metrics, inputs.get("task_type")))
+        return metrics
+    finally:
+        with _pool_lock:
+            _leases.pop(job_id, None)
+
+def enqueue(student: str, ex_id: str, job_id: str, inputs: dict, evaluate, points=None):
+    """
+    Score evaluate(**inputs) in the background and store the result on
+    (student, ex_id). points(metrics, task_type) -> int is added to the leaderboard.
+    The stored record must be leased to this process (pending_fields / _claim).
+    """
+    with _pool_lock:
+        _leases[job_id] = (student, ex_id)
+    _start_lease_thread()
+    fut = _executor().submit(_grade, student, ex_id, job_id, inputs, evaluate, points)
+    _jobs[job_id] = fut
+    # _grade has stored the result by the time fut is done; job_result reads it from there
+    fut.add_done_callback(lambda _fut: _jobs.pop(job_id, None))
+    return fut
+
+def job_result(job_id: str, student: str | None = None, ex_id: str | None = None):
+    """Metrics for a finished job, else None. Jobs that are done, or were queued
+    elsewhere, are looked up in storage (needs student and ex_id)."""
+    fut = _jobs.get(job_id)
+    if fut is not None:
+        if not fut.done():
+            return None
+        _jobs.pop(job_id, None)
+        try:
+            return fut.result()
+        except Exception:
+            return {}
+    if student is None or ex_id is None:
+        return None
+    sub = get_storage().student_submissions(student).get(ex_id) or {}
+    if sub.get("job_id") != job_id:
+        return {}  # superseded by a newer submission
+    return None if sub.get("status") == "pending" else sub.get("metrics", {})
+
+# ---------------- Leases ----------------
+def _renew(held: dict):
+    """Push out the lease of every record this process still holds (one storage write)."""
+    me, until = owner_id(), time.time() + _lease_sec()
+    jobs = {}
+    for job_id, key in held.items():
+        jobs.setdefault(key, set()).add(job_id)
+
+    def _extend(job_ids):
+        def _mut(sub):
+            if sub is None or sub.get("status") != "pending" or sub.get("job_id") not in job_ids \
+                    or sub.get("owner") != me:
+                return None
+            sub["lease_until"] = until
+            return sub
+        return _mut
+
+    get_storage().update_submissions({key: _extend(job_ids) for key, job_ids in jobs.items()})
+
+def _claim(student: str, ex_id: str, job_id: str) -> bool:
+    """Take over a pending record whose lease ran out; False if it was renewed or taken meanwhile."""
+    me = owner_id()
+
+    def _take(sub):
+        if sub is None or sub.get("status") != "pending" or sub.get("job_id") != job_id \
+                or sub.get("lease_until", 0) > time.time():
+            return None
+        sub["owner"] = me
+        sub["lease_until"] = time.time() + _lease_sec()
+        return sub
+
+    return get_storage().update_submission(student, ex_id, _take) is not None
+
+def _resume_expired(evaluate, points, inputs_for, app):
+    now = time.time()
+    for student, ex_id, sub in list(get_storage().iter_submissions()):
+        if sub.get("status") != "pending" or record_app(sub) != app or sub.get("lease_until", 0) > now:
+            continue
+        job_id = sub.get("job_id")
+        if job_id in _jobs:
+            continue
+        inputs = inputs_for(student, ex_id, sub)
+        if inputs is not None and _claim(student, ex_id, job_id):
+            enqueue(student, ex_id, job_id, inputs, evaluate, points)
+
+def _lease_loop():
+    last_scan = time.monotonic()
+    while True:
+        time.sleep(_lease_sec() / 3)
+        try:
+            with _pool_lock:
+                held = dict(_leases)
+            if held:
+                _renew(held)
+            if _resume_args is not None and time.monotonic() - last_scan >= _lease_sec():
+                last_scan = time.monotonic()
+                _resume_expired(*_resume_args)  # a replica died after we started
+        except Exception:
+            pass  # storage hiccup: try again next round
+
+def _start_lease_thread():
+    global _lease_thread
+    with _pool_lock:
+        if _lease_thread is None:
+            _lease_thread = threading.Thread(target=_lease_loop, name="grading-leases", daemon=True)
+            _lease_thread.start()
+
+def resume_pending(evaluate, points, inputs_for, app: str):
+    """
+    Once per process: take over this app's stored records still "pending" whose
+    lease ran out (the process grading them died) and re-queue them; the lease
+    thread repeats this every lease period. Jobs a live process holds, and the
+    other app's records, are left alone.
+    inputs_for(student, ex_id, sub) -> evaluate kwargs or None.
+    """
+    global _resume_args
+    with _pool_lock:
+        if _resume_args is not None:
+            return
+        _resume_args = (evaluate, points, inputs_for, app)
+    _resume_expired(evaluate, points, inputs_for, app)
+    _start_lease_thread()
+
+# ---------------- Bulk re-grading (headless) ----------------
+CHECKPOINT_FILE = DATA_DIR / "regrade.checkpoint"
+
+# How each app scores its submissions (see their _grading_inputs); re-grading follows
+# the app that made the submission, so e.g. main.py records get no sentence cosines.
+APP_SCORING = {
+    "main": {"reference": False, "sentence_metrics": False},
+    "translation_lab": {"reference": True, "sentence_metrics": True},
+}
+
+def _regrade_batch(records, sentence_metrics=True):
+    """
+    Worker side: metrics for a whole batch (one evaluate_batch call per per-record
+    sentence_metrics setting; False here turns them off for all), plus
+    feedback_core issues per record.
+    """
+    from metrics_core import evaluate_batch
+    from feedback_core import analyze
+    metrics = [None] * len(records)
+    groups = {}
+    for i, r in enumerate(records):
+        groups.setdefault(sentence_metrics and r.get("sentence_metrics", True), []).append(i)
+    for flag, idx in groups.items():
+        for i, m in zip(idx, evaluate_batch([records[i] for i in idx], sentence_metrics=flag)):
+            metrics[i] = m
+    out = []
+    for r, m in zip(records, metrics):
+        issues, direction = analyze(r["source_text"], r["student_text"])
+        out.append((m, {"direction": direction, "issues": [asdict(i) for i in issues]}))
+    return out
+
+def _regrade_record(ex, sub):
+    """
+    evaluate_batch record: the texts the student saw and, if the submitting app
+    uses one, the exercise's current reference; plus that app's sentence_metrics.
+    """
+    scoring = APP_SCORING.get(record_app(sub), APP_SCORING["translation_lab"])
+    return dict(
+        student_text=sub.get("student_text", "") or "",
+        mt_text=resolve_text(sub, "mt_text") or ex.get("mt_text"),
+        reference=ex.get("reference_text") if scoring["reference"] else None,
+        task_type=sub.get("task_type", "Translate"),
+        source_text=resolve_text(sub, "source_text") or ex.get("source_text", "") or "",
+        sentence_metrics=scoring["sentence_metrics"],
+    )
+
+def _regrade_mutation(student_text, metrics, feedback):
+    def _store(sub):
+        if sub is None or sub.get("student_text", "") != student_text:
+            return None  # resubmitted while we were scoring; the new job owns it
+        sub["metrics"] = metrics
+        sub["feedback"] = feedback
+        sub["status"] = "graded"
+        return sub
+    return _store
+
+def regrade(batch_size=64, workers=None, exercise=None, checkpoint=CHECKPOINT_FILE,
+            sentence_metrics=True, restart=False, log=print):
+    """
+    Re-score every stored submission (or one exercise's) with evaluate_batch and
+    feedback_core.analyze. Submissions are streamed from storage in batches that
+    run on a process pool, and each finished batch is written back right away.
+    Done (student, ex_id) pairs are appended to `checkpoint`, so a crashed run
+    resumes where it stopped; the file is removed after a complete run. A batch
+    that raises is counted as failed and left out of the checkpoint (the run goes
+    on, and the checkpoint is kept so a rerun retries just those).
+    Leaderboard points are left alone (they were awarded at submit time).
+    Each record is scored the way the app that made it scores (APP_SCORING);
+    sentence_metrics=False drops the sentence cosines for all of them.
+    Returns a summary dict with the throughput.
+    """
+    storage = get_storage()
+    exercises = load_json(EXERCISES_FILE, readonly=True)
+    checkpoint = Path(checkpoint)
+    if restart:
+        checkpoint.unlink(missing_ok=True)
+    done = set()
+    if checkpoint.exists():
+        with checkpoint.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(tuple(json.loads(line)))
+                except (json.JSONDecodeError, TypeError):
+                    continue  # torn last line from a crash
+    workers = workers or _workers()
+    stats = {"graded": 0, "skipped": 0, "missing_exercise": 0, "changed": 0, "failed": 0}
+
+    def _batches():
+        batch = []
+        for student, ex_id, sub in storage.iter_submissions():
+            if exercise is not None and ex_id != exercise:
+                continue
+            if (student, ex_id) in done:
+                stats["skipped"] += 1  # only what this run would have re-graded
+                continue
+            ex = exercises.get(ex_id)
+            if ex is None:
+                stats["missing_exercise"] += 1
+                continue
+            batch.append((student, ex_id, _regrade_record(ex, sub)))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    started = time.perf_counter()
+    ctx = multiprocessing.get_context("spawn")
+
+    def _new_pool():
+        return ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker)
+
+    pool = _new_pool()
+    with checkpoint.open("a", encoding="utf-8") as ckpt:
+        pending = {}
+
+        def _drain(block):
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED) if block else (
+                [f for f in pending if f.done()], None)
+            for fut in finished:
+                batch = pending.pop(fut)
+                try:
+                    results = fut.result()
+                except Exception as e:  # incl. BrokenProcessPool when a worker dies
+                    stats["failed"] += len(batch)
+                    log(f"  batch of {len(batch)} failed ({type(e).__name__}: {e}); left for a rerun")
+                    continue
+                written = storage.update_submissions({
+                    (student, ex_id): _regrade_mutation(rec["student_text"], metrics, feedback)
+                    for (student, ex_id, rec), (metrics, feedback) in zip(batch, results)})
+                stats["graded"] += len(written)
+                stats["changed"] += len(batch) - len(written)
+                for student, ex_id, _ in batch:
+                    ckpt.write(json.dumps([student, ex_id], ensure_ascii=False) + "\n")
+                ckpt.flush()
+                log(f"  {stats['graded'] + stats['changed']} submission(s) re-graded...")
+
+        try:
+            for batch in _batches():
+                records = [rec for _, _, rec in batch]
+                try:
+                    fut = pool.submit(_regrade_batch, records, sentence_metrics)
+                except BrokenProcessPool:
+                    pool.shutdown(wait=False)  # its pending batches fail in _drain
+                    pool = _new_pool()
+                    fut = pool.submit(_regrade_batch, records, sentence_metrics)
+                pending[fut] = batch
+                while len(pending) >= workers * 2:  # bounded: the store is streamed, not loaded
+                    _drain(block=True)
+                _drain(block=False)
+            while pending:
+                _drain(block=True)
+        finally:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    if not stats["failed"]:
+        checkpoint.unlink(missing_ok=True)
+    total = stats["graded"] + stats["changed"]
+    stats["seconds"] = round(elapsed, 2)
+    stats["per_second"] = round(total / elapsed, 2) if elapsed > 0 else None
+    return stats
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="EduApp grading utilities")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rg = sub.add_parser("regrade", help="re-score stored submissions (e.g. after adding a reference)")
+    rg.add_argument("--exercise", default=None, help="only this exercise id")
+    rg.add_argument("--batch-size", type=int, default=64)
+    rg.add_argument("--workers", type=int, default=None, help="worker processes (default: EDUAPP_GRADING_WORKERS)")
+    rg.add_argument("--checkpoint", default=str(CHECKPOINT_FILE))
+    rg.add_argument("--no-sentence-metrics", action="store_true",
+                    help="skip sentence-embedding cosines (default: as the app that made each submission)")
+    rg.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "regrade":
+        stats = regrade(batch_size=args.batch_size, workers=args.workers, exercise=args.exercise,
+                        checkpoint=args.checkpoint, sentence_metrics=not args.no_sentence_metrics,
+                        restart=args.restart, log=lambda m: print(m, file=sys.stderr))
+        print(f"{stats['graded']} submission(s) re-graded in {stats['seconds']}s "
+              f"({stats['per_second']} submissions/sec)")
+        if stats["skipped"]:
+            print(f"{stats['skipped']} already done by an earlier run (checkpoint)")
+        if stats["changed"]:
+            print(f"{stats['changed']} resubmitted meanwhile, left as is")
+        if stats["missing_exercise"]:
+            print(f"{stats['missing_exercise']} skipped: exercise no longer exists")
+        if stats["failed"]:
+            print(f"{stats['failed']} failed; run the same command again to retry them")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
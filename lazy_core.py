@@ -0,0 +1,134 @@
+# lazy_core.py — deferred imports for heavy optional backends, and import-time reports
+# The metric backends (sacrebleu, bert_score -> torch/transformers, sentence_transformers,
+# numpy), plotting and Parquet are only imported the first time they are used, so
+# the login page and instructor pages don't pay seconds of startup and hundreds of MB
+# for models they never run.
+# - lazy_import("pkg.mod", "Name"): a handle; .get() imports on first call and returns
+#   the module/attribute, or None if it can't be imported (like the old try/except
+#   blocks). Attribute access on the handle imports too, and raises if unavailable.
+# - import_timings(): how long each deferred import took in this process.
+# - `python lazy_core.py importtime` shows what importing each app module costs
+#   (a fresh interpreter per module, -X importtime), heaviest packages first.
+
+import os
+import sys
+import time
+import argparse
+import importlib
+import importlib.util
+import subprocess
+import threading
+
+_timings = {}  # "pkg.mod[:Name]" -> seconds spent importing it
+_lock = threading.RLock()
+_MISSING = object()
+
+class LazyImport:
+    """`from module import attr` (or `import module`), done on first use."""
+
+    def __init__(self, module: str, attr: str | None = None):
+        self._module = module
+        self._attr = attr
+        self._value = _MISSING
+        self._error = None
+
+    @property
+    def name(self) -> str:
+        return f"{self._module}:{self._attr}" if self._attr else self._module
+
+    def get(self):
+        """The module/attribute, or None if it can't be imported."""
+        if self._value is _MISSING:
+            with _lock:
+                if self._value is _MISSING:
+                    start = time.perf_counter()
+                    try:
+                        value = importlib.import_module(self._module)
+                        if self._attr:
+                            value = getattr(value, self._attr)
+                    except Exception as e:
+                        value, self._error = None, e
+                    _timings[self.name] = time.perf_counter() - start
+                    self._value = value
+        return self._value
+
+    def available(self) -> bool:
+        """Whether the module is installed, without importing it."""
+        if self._value is not _MISSING:
+            return self._value is not None
+        try:
+            return importlib.util.find_spec(self._module.split(".")[0]) is not None
+        except (ImportError, ValueError):
+            return False
+
+    def __getattr__(self, item):
+        value = self.get()
+        if value is None:
+            raise ImportError(f"{self.name} is not available: {self._error}")
+        return getattr(value, item)
+
+    def __call__(self, *args, **kwargs):
+        value = self.get()
+        if value is None:
+            raise ImportError(f"{self.name} is not available: {self._error}")
+        return value(*args, **kwargs)
+
+def lazy_import(module: str, attr: str | None = None) -> LazyImport:
+    return LazyImport(module, attr)
+
+def import_timings() -> list:
+    """[(name, seconds)] for the deferred imports done so far, slowest first."""
+    with _lock:
+        return sorted(_timings.items(), key=lambda kv: -kv[1])
+
+# ---------------- Import-time report ----------------
+APP_MODULES = ["storage_core", "text_core", "diff_core", "lexicon_core", "feedback_core",
+               "serving_core", "batching_core", "embedding_core", "warmup_core", "metrics_core",
+               "grading_core", "export_core", "streamlit", "pandas", "docx"]
+
+def importtime(module: str, top: int = 8):
+    """
+    (total seconds, [(package, cumulative seconds)], error) for importing module in a
+    fresh interpreter; the packages are its direct imports, heaviest first.
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    rows = []  # (level, name, cumulative microseconds), children listed before their parent
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue  # the header line
+        name = parts[2].strip()
+        rows.append(((len(parts[2]) - len(name)) // 2, name, int(parts[1])))
+    total, packages = 0, {}
+    for i in range(len(rows) - 1, -1, -1):
+        if rows[i][:2] == (0, module):
+            total = rows[i][2]
+            for level, name, us in reversed(rows[:i]):
+                if level == 0:
+                    break  # the import before ours (interpreter startup)
+                if level == 1:
+                    packages[name.split(".")[0]] = packages.get(name.split(".")[0], 0) + us
+            break
+    error = proc.stderr.strip().splitlines()[-1] if proc.returncode else None
+    heaviest = sorted(packages.items(), key=lambda kv: -kv[1])[:top]
+    return total / 1e6, [(pkg, us / 1e6) for pkg, us in heaviest], error
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="EduApp startup diagnostics")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    it = sub.add_parser("importtime", help="import cost of each app module (fresh interpreter each)")
+    it.add_argument("modules", nargs="*", default=APP_MODULES)
+    it.add_argument("--top", type=int, default=5, help="heaviest direct imports to list per module")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "importtime":
+        for module in args.modules:
+            total, heaviest, error = importtime(module, args.top)
+            detail = error or ", ".join(f"{pkg} {sec * 1000:.0f} ms" for pkg, sec in heaviest)
+            print(f"{module:<14} {total * 1000:7.0f} ms   {detail}")
+
+if __name__ == "__main__":
+    main()
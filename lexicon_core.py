@@ -0,0 +1,283 @@
+# lexicon_core.py — lexicons for feedback_core, and multi-phrase matching over them
+# - PhraseMatcher: an Aho–Corasick automaton over a fixed list of phrases. Built once
+#   per lexicon; after that every occurrence of every phrase is found in a single
+#   left-to-right scan of the text, whatever the number of phrases.
+# - Lexicon: one set of tables (collocations, prepositions, idioms) with their
+#   matchers, built on first use. feedback_core.analyze(..., lexicon=) takes one.
+# - LexiconStore: the tables read from files in a directory (EDUAPP_LEXICON_DIR,
+#   default data/lexicons/), one file per table: <kind>.json (the dict, as in
+#   feedback_core.py) or <kind>.tsv (one "key<TAB>value" per line; for collocations
+#   "preferred<TAB>wrong", one line per wrong form; "#" starts a comment). Tables
+#   without a file use the built-in ones. A file that changes on disk is picked up
+#   by the next current() call, without a restart. Compiled matchers are saved
+#   next to the files (.compiled/<kind>.json: plain JSON with the automaton's arrays as
+#   base64, never pickle, so a planted cache file can't run code) so a restart doesn't
+#   rebuild large glossaries.
+#   Precompile with:  python lexicon_core.py compile
+
+import os
+import sys
+import json
+import base64
+import argparse
+import threading
+from array import array
+from pathlib import Path
+from collections import deque
+
+from storage_core import DATA_DIR, _stamp
+from text_core import _norm_ar
+
+LEXICON_DIR = Path(os.getenv("EDUAPP_LEXICON_DIR", DATA_DIR / "lexicons"))
+COMPILED_VERSION = 2  # bump when PhraseMatcher's layout changes
+
+# kind -> (one key maps to a list of wrong forms?, how the phrases are folded for matching)
+KINDS = {
+    "en_collo": (True, lambda p: p.rstrip("*").lower()),  # "*" marks a minor (acceptable) variant
+    "ar_collo": (True, _norm_ar),
+    "ar_prep": (False, lambda p: p),
+    "idioms_en2ar": (False, str.lower),
+    "idioms_ar2en": (False, str.lower),
+}
+
+# ---------------- Matcher ----------------
+_RADIX = 0x110000  # one past the largest code point
+
+class PhraseMatcher:
+    """
+    Aho–Corasick automaton over `phrases` (matched literally, so fold case or
+    normalize letters on both sides beforehand). Transitions live in one flat
+    dict keyed on node * 0x110000 + code point, failure/output links in arrays,
+    which keeps 50k-phrase glossaries small in memory and quick to save and reload (to_state / from_state).
+    """
+
+    def __init__(self, phrases):
+        self.lengths = array("l", (len(p) for p in phrases))
+        children = [{}]  # trie while building: node -> {char: next node}
+        ends = {}        # node -> ids of the phrases ending there
+        for pid, phrase in enumerate(phrases):
+            if not phrase:
+                continue
+            node = 0
+            for c in phrase:
+                nxt = children[node].get(c)
+                if nxt is None:
+                    nxt = len(children)
+                    children[node][c] = nxt
+                    children.append({})
+                node = nxt
+            ends[node] = ends.get(node, ()) + (pid,)
+
+        goto = {node * _RADIX + ord(c): nxt for node, kids in enumerate(children) for c, nxt in kids.items()}
+        fail = array("l", [0]) * len(children)
+        link = array("l", fail)  # nearest proper suffix node that ends a phrase (0: none)
+        queue = deque(children[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, nxt in children[node].items():
+                o = ord(c)
+                f = fail[node]
+                while f and f * _RADIX + o not in goto:
+                    f = fail[f]
+                fail[nxt] = goto.get(f * _RADIX + o, 0)
+                link[nxt] = fail[nxt] if fail[nxt] in ends else link[fail[nxt]]
+                queue.append(nxt)
+        self.goto, self.fail, self.ends, self.link = goto, fail, ends, link
+
+    def to_state(self) -> dict:
+        """The automaton as JSON-serializable data (arrays as base64 of 64-bit ints)."""
+        ends = list(self.ends.items())
+        return {"lengths": _pack(self.lengths), "goto_keys": _pack(self.goto.keys()),
+                "goto_next": _pack(self.goto.values()), "fail": _pack(self.fail), "link": _pack(self.link),
+                "end_nodes": _pack(n for n, _ in ends), "end_counts": _pack(len(p) for _, p in ends),
+                "end_pids": _pack(pid for _, p in ends for pid in p)}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "PhraseMatcher":
+        """Inverse of to_state(); ValueError if the arrays don't fit together."""
+        self = cls.__new__(cls)
+        self.lengths, self.fail, self.link = (_unpack(state[k]) for k in ("lengths", "fail", "link"))
+        keys, nexts = _unpack(state["goto_keys"]), _unpack(state["goto_next"])
+        nodes, counts, pids = (_unpack(state[k]) for k in ("end_nodes", "end_counts", "end_pids"))
+        size = len(self.fail)
+        if (len(keys) != len(nexts) or len(self.link) != size or len(nodes) != len(counts) or sum(counts) != len(pids)
+                or any(min(a, default=0) < 0 or max(a, default=0) >= size for a in (nexts, self.fail, self.link, nodes))
+                or min(pids, default=0) < 0 or max(pids, default=0) >= len(self.lengths)):
+            raise ValueError("inconsistent PhraseMatcher state")
+        self.goto = dict(zip(keys, nexts))
+        self.ends, start = {}, 0
+        for node, count in zip(nodes, counts):
+            self.ends[node] = tuple(pids[start:start + count])
+            start += count
+        return self
+
+    def finditer(self, text):
+        """(start, end, phrase id) for every occurrence, overlapping ones included, by end position."""
+        goto, fail, ends, link, lengths = self.goto, self.fail, self.ends, self.link, self.lengths
+        node = 0
+        for i, c in enumerate(text):
+            o = ord(c)
+            nxt = goto.get(node * _RADIX + o)
+            while nxt is None and node:
+                node = fail[node]
+                nxt = goto.get(node * _RADIX + o)
+            node = nxt or 0
+            out = node if node in ends else link[node]
+            while out:
+                for pid in ends[out]:
+                    yield i + 1 - lengths[pid], i + 1, pid
+                out = link[out]
+
+    def first(self, text) -> dict:
+        """phrase id -> (start, end) of its first occurrence, for the phrases that occur."""
+        found = {}
+        for start, end, pid in self.finditer(text):
+            if pid not in found:
+                found[pid] = (start, end)
+        return found
+
+def _pack(values) -> str:
+    return base64.b64encode(array("q", values).tobytes()).decode("ascii")
+
+def _unpack(text: str) -> array:
+    out = array("q")
+    out.frombytes(base64.b64decode(text))
+    return out
+
+def compile_table(kind: str, table: dict):
+    """(entries, PhraseMatcher) for one table; entries[phrase id] is (key, value) or (key, wrong form)."""
+    multi, fold = KINDS[kind]
+    if multi:
+        entries = [(key, wrong) for key, wrongs in table.items() for wrong in wrongs]
+        phrases = [fold(wrong) for _, wrong in entries]
+    else:
+        entries = list(table.items())
+        phrases = [fold(key) for key, _ in entries]
+    return entries, PhraseMatcher(phrases)
+
+# ---------------- Lexicons ----------------
+class Lexicon:
+    """One set of tables (kind -> dict) and their matchers. Treat as read-only."""
+
+    def __init__(self, tables: dict, compiled: dict | None = None):
+        self.tables = tables
+        self._compiled = dict(compiled or {})  # kind -> (entries, PhraseMatcher)
+        self._lock = threading.Lock()
+
+    def matcher(self, kind: str):
+        """(entries, PhraseMatcher) for one table, compiled on first use."""
+        hit = self._compiled.get(kind)
+        if hit is None:
+            with self._lock:
+                hit = self._compiled.get(kind)
+                if hit is None:
+                    hit = self._compiled[kind] = compile_table(kind, self.tables.get(kind, {}))
+        return hit
+
+    def current(self) -> "Lexicon":
+        return self  # same interface as LexiconStore
+
+def _read_table(kind: str, path: Path) -> dict:
+    if path.suffix == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    multi = KINDS[kind][0]
+    table = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            key, _, value = line.partition("\t")
+            key, value = key.strip(), value.strip()
+            if not key or not value:
+                continue
+            if multi:
+                table.setdefault(key, []).append(value)
+            else:
+                table[key] = value
+    return table
+
+class LexiconStore:
+    """Tables from <directory>/<kind>.json|.tsv (built-in defaults otherwise), reloaded on change."""
+
+    def __init__(self, directory=LEXICON_DIR, defaults: dict | None = None):
+        self.directory = Path(directory)
+        self.defaults = defaults or {}
+        self._lock = threading.Lock()
+        self._versions = {}  # kind -> (path, stamp) the loaded table came from
+        self._loaded = {}    # kind -> (table, (entries, PhraseMatcher) or None)
+        self._lexicon = None
+
+    def _source(self, kind: str):
+        for ext in (".json", ".tsv"):
+            path = self.directory / f"{kind}{ext}"
+            stamp = _stamp(path)
+            if stamp is not None:
+                return path, stamp
+        return None, None
+
+    def current(self) -> Lexicon:
+        """The Lexicon for the files as they are now; costs a few stat() calls when nothing changed."""
+        versions = {kind: self._source(kind) for kind in KINDS}
+        if versions != self._versions or self._lexicon is None:
+            with self._lock:
+                if versions != self._versions or self._lexicon is None:
+                    for kind, (path, stamp) in versions.items():
+                        if self._versions.get(kind) != (path, stamp) or kind not in self._loaded:
+                            self._loaded[kind] = self._load(kind, path, stamp)
+                    self._versions = versions
+                    self._lexicon = Lexicon({k: t for k, (t, _) in self._loaded.items()},
+                                            {k: c for k, (_, c) in self._loaded.items() if c is not None})
+        return self._lexicon
+
+    def _compiled_file(self, kind: str) -> Path:
+        return self.directory / ".compiled" / f"{kind}.json"
+
+    def _load(self, kind, path, stamp):
+        if path is None:
+            return self.defaults.get(kind, {}), None  # small built-in table, compiled on use
+        key = [COMPILED_VERSION, sys.byteorder, path.name, stamp[1], stamp[2]]  # name, mtime_ns, size
+        try:
+            with open(self._compiled_file(kind), "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved["key"] == key:
+                entries = [tuple(e) for e in saved["entries"]]
+                return saved["table"], (entries, PhraseMatcher.from_state(saved["matcher"]))
+        except Exception:
+            pass  # missing, stale or unreadable: rebuild below
+        try:
+            table = _read_table(kind, path)
+        except Exception:
+            return self._loaded.get(kind, (self.defaults.get(kind, {}), None))  # half-written? keep what we had
+        compiled = compile_table(kind, table)
+        try:
+            out = self._compiled_file(kind)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            tmp = out.with_suffix(f".{os.getpid()}.tmp")
+            entries, matcher = compiled
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "table": table, "entries": entries, "matcher": matcher.to_state()},
+                          f, ensure_ascii=False)
+            os.replace(tmp, out)
+        except OSError:
+            pass  # read-only volume: just compile again next start
+        return table, compiled
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="EduApp feedback lexicons")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("compile", help=f"load and precompile every lexicon file in {LEXICON_DIR}")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "compile":
+        from feedback_core import get_lexicons
+        store = get_lexicons()
+        lexicon = store.current()
+        for kind in KINDS:
+            path, _ = store._source(kind)
+            entries, _ = lexicon.matcher(kind)
+            print(f"{kind}: {len(entries)} entries ({path or 'built-in'})")
+
+if __name__ == "__main__":
+    main()
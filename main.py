@@ -1,76 +1,38 @@
 # main.py  — EduApp (single file)
 # - Evidence-based adaptive feedback (with concrete examples)
 # - Safer instructor login (env var or SHA256; fallback for dev)
-# - JSON storage maintained (no DB migration needed)
+# - JSON storage maintained by default; optional SQLite backend (EDUAPP_STORAGE=sqlite, see storage_core.py)
 # - Reflection capture, progress charts, class snapshot
 # - Graceful fallbacks for optional libs; no crashes on missing deps
 
 import os
 import re
-import json
+import tempfile
 import time
 import hashlib
 import random
-import threading
 from io import BytesIO
-from pathlib import Path
-from typing import List, Tuple
-from difflib import SequenceMatcher, ndiff
+from functools import partial, lru_cache
 import datetime
 
 import streamlit as st
-import pandas as pd
 from docx import Document
-from docx.shared import RGBColor
-
-# Optional metrics deps (graceful fallback if missing)
-try:
-    import sacrebleu
-except Exception:
-    sacrebleu = None
-
-try:
-    from bert_score import score as bertscore_score
-except Exception:
-    bertscore_score = None
-
-# Optional plotting
-try:
-    import matplotlib.pyplot as plt  # noqa: F401
-    _HAVE_MPL = True
-except Exception:
-    _HAVE_MPL = False
+
+# pandas and optional plotting, imported on first use (see lazy_core.py)
+from lazy_core import lazy_import
+pd = lazy_import("pandas")
+plt = lazy_import("matplotlib.pyplot")
+_HAVE_MPL = plt.available()
 
 # ---------------- Proof-of-life banner (so you know this file is loaded) ----------------
 THIS_FILE = os.path.abspath(__file__)
 LAST_EDIT = datetime.datetime.fromtimestamp(os.path.getmtime(THIS_FILE))
 
-# ---------------- Storage (JSON with basic locking & atomic writes) ----------------
-DATA_DIR = Path("./data")
-DATA_DIR.mkdir(exist_ok=True)
-
-EXERCISES_FILE = DATA_DIR / "exercises.json"
-SUBMISSIONS_FILE = DATA_DIR / "submissions.json"
-LEADERBOARD_FILE = DATA_DIR / "leaderboard.json"
-
-_lock = threading.Lock()
-
-def load_json(file: Path):
-    file = Path(file)
-    if file.exists():
-        with file.open("r", encoding="utf-8") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return {}
-    return {}
-
-def save_json(file: Path, data):
-    with _lock:
-        tmp = Path(str(file) + ".tmp")
-        with tmp.open("w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-        tmp.replace(file)
+# ---------------- Storage (pluggable: JSON files by default, SQLite via EDUAPP_STORAGE) ----------------
+from storage_core import (
+    EXERCISES_FILE, LEADERBOARD_FILE,
+    load_json, save_json, get_storage, put_text,
+)
 
 # ---------------- Auth (safer than hard-coded) ----------------
 def _env(name, default=""):
@@ -94,178 +56,75 @@ def check_password(typed: str) -> bool:
     except Exception:
         return False  # never crash on login
 
-# ---------------- Tokenization & Edit Helpers ----------------
-_token_re = re.compile(r"\w+|[^\w\s]", re.UNICODE)
-
-def _tokenize(s: str) -> List[str]:
-    return _token_re.findall(s or "")
-
-def compute_edit_details(mt_text: str, student_text: str) -> Tuple[int, int, int]:
-    mt_tokens = _tokenize(mt_text)
-    st_tokens = _tokenize(student_text)
-    matcher = SequenceMatcher(None, mt_tokens, st_tokens)
-
-    additions = deletions = replacements = 0
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-        if tag == "insert":
-            additions += (j2 - j1)
-        elif tag == "delete":
-            deletions += (i2 - i1)
-        elif tag == "replace":
-            replacements += max(i2 - i1, j2 - j1)
-    total_edits = additions + deletions + replacements
-    return additions, deletions, total_edits
-
-# ---------------- Metrics ----------------
-def evaluate_translation(student_text, mt_text=None, reference=None, task_type="Translate", source_text=""):
-    """
-    Returns a metrics dict using:
-      - length_ratio (target tokens / source tokens)
-      - BLEU (sacrebleu, if reference provided)
-      - chrF++ (sacrebleu, if reference provided)
-      - BERTScore_F1 (if available & reference provided)
-      - edit counts for post-edit tasks
-    All metrics gracefully fallback to None if libs or references are missing.
-    """
-    src_len = max(1, len(_tokenize(source_text)))
-    tgt_len = len(_tokenize(student_text))
-    length_ratio = round(tgt_len / src_len, 3)
+# ---------------- Edit Helpers & Metrics (shared, see metrics_core.py) ----------------
+from metrics_core import evaluate_translation
+from text_core import analyze_text  # one tokenization per text, shared with metrics/feedback/diff
 
-    if task_type == "Post-edit MT" and mt_text:
-        additions, deletions, edits = compute_edit_details(mt_text, student_text)
-    else:
-        additions = deletions = edits = 0
+# ---------------- Background grading (submit returns at once, see grading_core.py) ----------------
+from grading_core import new_job_id, enqueue, job_result, resume_pending, warm_up, pending_fields
+GRADING_APP = "main"  # tags this app's submissions, so resume/re-grade score them as this app does
 
-    bleu = chrf = bert_f1 = None
-    if reference:
-        refs = [reference]
-        try:
-            if sacrebleu:
-                bleu = float(sacrebleu.corpus_bleu([student_text], [refs]).score)  # 0-100
-                chrf = float(sacrebleu.corpus_chrf([student_text], [refs]).score)  # 0-100
-        except Exception:
-            bleu = None
-            chrf = None
-        try:
-            if bertscore_score:
-                P, R, F1 = bertscore_score([student_text], [reference], lang="en")
-                bert_f1 = float(F1.mean().item())  # 0-1
-        except Exception:
-            bert_f1 = None
-
-    return {
-        "length_ratio": length_ratio,
-        "BLEU": None if bleu is None else round(bleu, 2),
-        "chrF++": None if chrf is None else round(chrf, 2),
-        "BERTScore_F1": None if bert_f1 is None else round(bert_f1, 3),
-        "additions": additions,
-        "deletions": deletions,
-        "edits": edits
-    }
-
-# ---------------- Track Changes (HTML + DOCX) ----------------
-def _join_tokens_for_display(tokens: List[str]) -> str:
-    out = " ".join(tokens)
-    out = re.sub(r"\s+([.,!?;:])", r"\1", out)
-    return out
-
-def diff_text(baseline: str, student_text: str) -> str:
-    differ = ndiff(_tokenize(baseline), _tokenize(student_text))
-    parts = []
-    for w in differ:
-        token = w[2:]
-        if w.startswith("- "):
-            parts.append(f"<span style='color:#c00;text-decoration:line-through'>{token}</span>")
-        elif w.startswith("+ "):
-            parts.append(f"<span style='color:#080'>{token}</span>")
-        else:
-            parts.append(token)
-    return _join_tokens_for_display(parts)
-
-def add_diff_to_doc(doc: Document, baseline: str, student_text: str):
-    differ = ndiff(_tokenize(baseline), _tokenize(student_text))
-    p = doc.add_paragraph()
-    for w in differ:
-        token = w[2:]
-        if w.startswith("- "):
-            run = p.add_run(token + " ")
-            run.font.strike = True
-            run.font.color.rgb = RGBColor(255, 0, 0)
-        elif w.startswith("+ "):
-            run = p.add_run(token + " ")
-            run.font.color.rgb = RGBColor(0, 128, 0)
-        else:
-            p.add_run(token + " ")
+# ---------------- Track Changes (HTML + DOCX, see diff_core.py) ----------------
+from diff_core import diff_text
 
 # ---------------- Exports ----------------
-def export_student_word(submissions, student_name):
-    doc = Document()
-    doc.add_heading(f"Student: {student_name}", 0)
-    subs = submissions.get(student_name, {})
-    for ex_id, sub in subs.items():
-        doc.add_heading(f"Exercise {ex_id}", level=1)
-        doc.add_paragraph("Source Text:")
-        doc.add_paragraph(sub.get("source_text", ""))
-        if sub.get("mt_text"):
-            doc.add_paragraph("MT Output:")
-            doc.add_paragraph(sub.get("mt_text", ""))
-
-        if sub.get("task_type") == "Post-edit MT":
-            doc.add_paragraph("Student Submission (Track Changes):")
-            base = sub.get("mt_text", "") or ""
-            add_diff_to_doc(doc, base, sub.get("student_text", ""))
-        else:
-            doc.add_paragraph("Student Submission:")
-            doc.add_paragraph(sub.get("student_text", ""))
-
-        metrics = sub.get("metrics", {})
-        doc.add_paragraph(f"Metrics: {metrics}")
-        doc.add_paragraph(f"Task Type: {sub.get('task_type','')}")
-        doc.add_paragraph(f"Time Spent: {sub.get('time_spent_sec', 0):.2f} sec")
-        doc.add_paragraph(f"Characters (not keystrokes): {sub.get('keystrokes', 0)}")
-        if sub.get("reflection"):
-            doc.add_paragraph("Reflection:")
-            doc.add_paragraph(sub.get("reflection"))
-        doc.add_paragraph("---")
+from export_core import (
+    SUMMARY_COLUMNS, SUMMARY_FORMATS, write_summary, deferred, content_key, cached_export,
+    student_report, export_class_zip, class_records, DEFERRED_DOWNLOADS,
+)
+
+SUMMARY_COLUMNS_MAIN = [c for c in SUMMARY_COLUMNS if not c.startswith("SentenceCosine")]  # not scored here
 
+def export_exercise_word(ex_id, ex):
+    doc = Document()
+    doc.add_heading(f"Exercise {ex_id}", 0)
+    doc.add_paragraph("Source Text:")
+    doc.add_paragraph(ex.get("source_text", ""))
+    if ex.get("mt_text"):
+        doc.add_paragraph("MT Output:")
+        doc.add_paragraph(ex.get("mt_text", ""))
     buf = BytesIO()
     doc.save(buf)
     buf.seek(0)
     return buf
 
-def export_summary_excel(submissions):
-    rows = []
-    for student, subs in submissions.items():
-        for ex_id, sub in subs.items():
-            m = sub.get("metrics", {})
-            rows.append({
-                "Student": student,
-                "Exercise": ex_id,
-                "Task Type": sub.get("task_type", ""),
-                "Length Ratio": m.get("length_ratio"),
-                "BLEU": m.get("BLEU"),
-                "chrF++": m.get("chrF++"),
-                "BERTScore_F1": m.get("BERTScore_F1"),
-                "Additions": m.get("additions"),
-                "Deletions": m.get("deletions"),
-                "Edits": m.get("edits"),
-                "Time Spent (s)": sub.get("time_spent_sec", 0),
-                "Characters Typed": sub.get("keystrokes", 0)
-            })
-    df = pd.DataFrame(rows)
-    buf = BytesIO()
-    df.to_excel(buf, index=False)
-    buf.seek(0)
-    return buf
+def export_student_word(submissions, student_name):
+    return student_report(student_name, submissions.get(student_name, {}), reflection=True)
+
+def export_class_word():
+    """Every student's report in one ZIP, built in a temp file on a worker pool."""
+    tmp = tempfile.TemporaryFile(buffering=0)  # raw file object, accepted by st.download_button
+    export_class_zip(class_records(get_storage()), tmp, reflection=True)
+    tmp.seek(0)
+    return tmp
+
+def export_summary_excel(records, fmt="xlsx"):
+    """records: iterable of (student, ex_id, submission), e.g. get_storage().iter_submissions()."""
+    tmp = tempfile.TemporaryFile(buffering=0)  # on disk, not in memory, while it is written
+    write_summary(records, tmp, fmt, columns=SUMMARY_COLUMNS_MAIN)
+    tmp.seek(0)
+    return tmp
 
 # ---------------- Gamification ----------------
 def load_leaderboard():
-    return load_json(LEADERBOARD_FILE)
+    return load_json(LEADERBOARD_FILE, readonly=True)
 
 def update_leaderboard(student_name, points):
-    leaderboard = load_leaderboard()
-    leaderboard[student_name] = leaderboard.get(student_name, 0) + points
-    save_json(LEADERBOARD_FILE, leaderboard)
+    get_storage().add_points(student_name, points)
+
+def submission_points(metrics, task_type):
+    """Leaderboard points for one graded submission (BLEU/chrF++ might be None if no reference)."""
+    points = 0
+    try:
+        if metrics.get("BLEU") is not None:
+            points += int(metrics["BLEU"])
+        if metrics.get("chrF++") is not None:
+            points += int(metrics["chrF++"] / 2)  # dampen chrF
+        if task_type == "Post-edit MT":
+            points += max(0, 10 - int(metrics["edits"]))
+    except Exception:
+        pass
+    return points
 
 def show_leaderboard():
     leaderboard = load_leaderboard()
@@ -304,9 +163,10 @@ def ai_generate_text(prompt):
 _AR_LETTERS = r"\u0600-\u06FF"  # Arabic Unicode block
 
 def _tokenize_words(text: str):
-    # words incl. hyphen/apostrophes; keep numbers as tokens
-    return re.findall(r"[A-Za-z" + _AR_LETTERS + r"]+[’'\-]?[A-Za-z" + _AR_LETTERS + r"]+|\d+(?:[.,]\d+)?", text)
+    # words incl. hyphen/apostrophes; keep numbers as tokens (see text_core.AnalyzedText.words)
+    return analyze_text(text).words
 
+@lru_cache(maxsize=256)
 def _likely_terms(source_text: str):
     """
     Heuristics for 'terms/proper names':
@@ -314,6 +174,7 @@ def _likely_terms(source_text: str):
     - Contains hyphen or digits
     - Quoted spans
     - Arabic words length>=4
+    Depends on the exercise text only, so it is computed once per exercise.
     """
     terms = set()
     # quoted chunks
@@ -331,7 +192,7 @@ def _likely_terms(source_text: str):
             terms.add(w)
         elif re.match(r"[" + _AR_LETTERS + r"]{4,}$", w):  # Arabic word len>=4
             terms.add(w)
-    return terms
+    return frozenset(terms)
 
 def _short_list(items, n=4):
     items = list(items)
@@ -345,9 +206,8 @@ def quick_linguistic_hints(source_text: str, student_text: str):
     hints = []
     try:
         # Numbers: exact evidence
-        src_nums = set(re.findall(r"\d+(?:[.,]\d+)?", source_text))
-        tgt_nums = set(re.findall(r"\d+(?:[.,]\d+)?", student_text))
-        missing_nums = sorted(src_nums - tgt_nums, key=lambda x: (len(x), x))
+        src, tgt = analyze_text(source_text), analyze_text(student_text)
+        missing_nums = sorted(src.numbers - tgt.numbers, key=lambda x: (len(x), x))
         if missing_nums:
             hints.append({
                 "rule": "numbers_missing",
@@ -357,23 +217,23 @@ def quick_linguistic_hints(source_text: str, student_text: str):
 
         # Brackets & quotes balance
         for sym_open, sym_close, label in [("(", ")", "parentheses"), ("[", "]", "brackets"), ("{", "}", "braces")]:
-            if source_text.count(sym_open) != student_text.count(sym_close):
+            if src.char_counts[sym_open] != tgt.char_counts[sym_close]:
                 hints.append({
                     "rule": f"{label}_unbalanced",
                     "message": f"{label.capitalize()} look unbalanced.",
-                    "evidence": (f"Source {sym_open}/{sym_close}: {source_text.count(sym_open)}/{source_text.count(sym_close)}; "
-                                 f"Your text: {student_text.count(sym_open)}/{student_text.count(sym_close)}")
+                    "evidence": (f"Source {sym_open}/{sym_close}: {src.char_counts[sym_open]}/{src.char_counts[sym_close]}; "
+                                 f"Your text: {tgt.char_counts[sym_open]}/{tgt.char_counts[sym_close]}")
                 })
-        if source_text.count('"') != student_text.count('"'):
+        if src.char_counts['"'] != tgt.char_counts['"']:
             hints.append({
                 "rule": "quotes_unbalanced",
                 "message": "Quotation marks may be unbalanced.",
-                "evidence": f'Source quotes: {source_text.count(chr(34))}; Yours: {student_text.count(chr(34))}'
+                "evidence": f'Source quotes: {src.char_counts[chr(34)]}; Yours: {tgt.char_counts[chr(34)]}'
             })
 
         # Terms/proper names: concrete examples
         src_terms = _likely_terms(source_text)
-        tgt_tokens = set(_tokenize_words(student_text))
+        tgt_tokens = tgt.word_set
         missing_terms = sorted([t for t in src_terms if t not in tgt_tokens], key=lambda x: (-len(x), x))
         if missing_terms:
             hints.append({
@@ -467,7 +327,8 @@ def instructor_dashboard():
         return
 
     exercises = load_json(EXERCISES_FILE)
-    submissions = load_json(SUBMISSIONS_FILE)
+    storage = get_storage()
+    students = storage.students()  # submissions themselves are read per student / streamed
 
     st.subheader("Create / Edit / Delete Exercise")
     ex_ids = ["New"] + list(exercises.keys())
@@ -530,19 +391,10 @@ def instructor_dashboard():
     if exercises:
         for ex_id, ex in exercises.items():
             try:
-                buf = BytesIO()
-                doc = Document()
-                doc.add_heading(f"Exercise {ex_id}", 0)
-                doc.add_paragraph("Source Text:")
-                doc.add_paragraph(ex.get("source_text", ""))
-                if ex.get("mt_text"):
-                    doc.add_paragraph("MT Output:")
-                    doc.add_paragraph(ex.get("mt_text", ""))
-                doc.save(buf)
-                buf.seek(0)
+                key = content_key("exercise_word", ex_id, ex)  # rebuilt only when the exercise changes
                 st.download_button(
                     f"Exercise {ex_id} (Word)",
-                    buf,
+                    deferred(partial(cached_export, key, export_exercise_word, ex_id, ex)),
                     file_name=f"Exercise_{ex_id}.docx",
                     mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
                 )
@@ -552,39 +404,50 @@ def instructor_dashboard():
         st.info("No exercises yet.")
 
     st.subheader("Student Submissions & Exports")
-    if submissions:
-        student_choice = st.selectbox("Choose student", ["All"] + list(submissions.keys()))
+    if students:
+        student_choice = st.selectbox("Choose student", ["All"] + students)
         if student_choice != "All":
-            buf = export_student_word(submissions, student_choice)
+            chosen = {student_choice: storage.student_submissions(student_choice)}
+            key = content_key("student_word", chosen)  # reused until this student's records change
             safe_name = re.sub(r"[^\w\-]+", "_", student_choice)
             st.download_button(
                 f"Download {student_choice}'s Submissions (Word)",
-                buf,
+                deferred(partial(cached_export, key, export_student_word, chosen, student_choice)),
                 file_name=f"{safe_name}_submissions.docx",
                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
             )
 
-        st.subheader("Download Metrics Summary (Excel)")
-        excel_buf = export_summary_excel(submissions)
+        st.subheader("Export Whole Class (Word, ZIP)")
+        # Without deferred downloads the ZIP would be rebuilt on every rerun; ask first
+        if DEFERRED_DOWNLOADS or st.button("Prepare class ZIP"):
+            st.download_button(
+                "Download All Students (ZIP)",
+                deferred(export_class_word),
+                file_name="class_submissions.zip",
+                mime="application/zip"
+            )
+
+        st.subheader("Download Metrics Summary")
+        fmt_label = st.radio("Summary format", list(SUMMARY_FORMATS), horizontal=True)
+        ext, mime = SUMMARY_FORMATS[fmt_label]
         st.download_button(
-            "Download Excel Summary",
-            excel_buf,
-            file_name="metrics_summary.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            f"Download {fmt_label} Summary",
+            deferred(lambda: export_summary_excel(storage.iter_submissions(), ext)),  # streamed, built on click
+            file_name=f"metrics_summary.{ext}",
+            mime=mime
         )
 
         # Class Snapshot (mean chrF++ per exercise)
         try:
             st.subheader("Class Snapshot")
+            per_ex = {}  # ex_id -> chrF++ values, one pass over the streamed submissions
+            for _student, ex_id2, sub in storage.iter_submissions():
+                m = sub.get("metrics", {})
+                if m.get("chrF++") is not None:
+                    per_ex.setdefault(ex_id2, []).append(m["chrF++"])
             rows = []
-            for ex_id2, ex in exercises.items():
-                vals = []
-                for student, subs in submissions.items():
-                    sub = subs.get(ex_id2)
-                    if sub:
-                        m = sub.get("metrics", {})
-                        if m.get("chrF++") is not None:
-                            vals.append(m["chrF++"])
+            for ex_id2 in exercises:
+                vals = per_ex.get(ex_id2, [])
                 if vals:
                     mean_val = round(sum(vals) / max(1, len(vals)), 2)
                     rows.append({"Exercise": ex_id2, "chrF++ mean": mean_val, "n": len(vals)})
@@ -603,19 +466,17 @@ def instructor_dashboard():
 def student_dashboard():
     st.title("Student Dashboard")
 
-    exercises = load_json(EXERCISES_FILE)
+    exercises = load_json(EXERCISES_FILE, readonly=True)
     if not exercises:
         st.info("No exercises available yet. Please check back later.")
         return
 
-    submissions = load_json(SUBMISSIONS_FILE)
     student_name = st.text_input("Enter your name")
     if not student_name:
         return
 
-    # Ensure per-student container in JSON
-    if student_name not in submissions:
-        submissions[student_name] = {}
+    # Only this student's submissions are read/written (a single row upsert on SQLite)
+    my_submissions = get_storage().student_submissions(student_name)
 
     ex_id = st.selectbox("Choose Exercise", list(exercises.keys()))
     if not ex_id:
@@ -650,51 +511,85 @@ def student_dashboard():
         reflection = st.text_area("Brief reflection (what changed / why?)", "", height=80)
         submitted = st.form_submit_button("Submit")
 
+    job_key = f"grading_{student_name}_{ex_id}"
     if submitted:
         time_spent = time.time() - st.session_state[start_key]
         st.session_state[keys_key] = len(student_text)  # characters typed proxy
 
-        metrics = evaluate_translation(
-            student_text,
-            mt_text=ex.get("mt_text"),
-            reference=None,  # plug in a gold reference here if available
-            task_type=task_type,
-            source_text=ex.get("source_text", "")
-        )
-
-        # Persist submission
-        submissions[student_name][ex_id] = {
-            "source_text": ex.get("source_text", ""),
-            "mt_text": ex.get("mt_text"),
+        # Persist right away; the metrics are filled in by a background worker
+        job_id = new_job_id()
+        my_submissions[ex_id] = {
+            "source_ref": put_text(ex.get("source_text", "")),  # texts stored once, by hash
+            "mt_ref": put_text(ex.get("mt_text")),
             "student_text": student_text,
             "task_type": task_type,
             "time_spent_sec": round(time_spent, 2),
             "keystrokes": st.session_state[keys_key],  # actually characters
-            "metrics": metrics,
+            "metrics": {},
+            **pending_fields(job_id, GRADING_APP),  # status, job_id, lease to this process
             "reflection": reflection
         }
-        save_json(SUBMISSIONS_FILE, submissions)
+        get_storage().put_submission(student_name, ex_id, my_submissions[ex_id])
+        enqueue(student_name, ex_id, job_id, _grading_inputs(ex, student_text, task_type),
+                evaluate_translation, submission_points)
+        st.session_state[job_key] = {
+            "job_id": job_id, "student_text": student_text, "task_type": task_type,
+            "time_spent": time_spent, "chars": st.session_state[keys_key], "metrics": None,
+        }
+        st.success("Submission saved! Your scores and feedback will appear below in a moment.")
 
-        # Gamification points (BLEU/chrF++ might be None if no reference)
-        points = 0
-        try:
-            if metrics.get("BLEU") is not None:
-                points += int(metrics["BLEU"])
-            if metrics.get("chrF++") is not None:
-                points += int(metrics["chrF++"] / 2)  # dampen chrF
-            if task_type == "Post-edit MT":
-                points += max(0, 10 - int(metrics["edits"]))
-        except Exception:
-            pass
-        update_leaderboard(student_name, points)
+    job = st.session_state.get(job_key)
+    if job is None:
+        return
+    if job["metrics"] is None:
+        _poll_grading(job, student_name, ex_id)
+        return
+    show_results(job, ex, my_submissions)
+
+def _grading_inputs(ex, student_text, task_type):
+    """
+    evaluate_translation kwargs: length_ratio, BLEU/chrF++/BERTScore_F1 (if a
+    reference is provided) and edit counts for post-edit tasks.
+    No sentence-embedding scores in this app.
+    """
+    return dict(
+        student_text=student_text,
+        mt_text=ex.get("mt_text"),
+        reference=None,  # plug in a gold reference here if available
+        task_type=task_type,
+        source_text=ex.get("source_text", ""),
+        sentence_metrics=False,
+    )
+
+def _resume_inputs(student, ex_id, sub):
+    """Rebuild the evaluate kwargs of a submission left pending by a restart."""
+    ex = load_json(EXERCISES_FILE, readonly=True).get(ex_id)
+    if ex is None:
+        return None
+    return _grading_inputs(ex, sub.get("student_text", ""), sub.get("task_type", "Translate"))
+
+@st.fragment(run_every=2)
+def _poll_grading(job, student_name, ex_id):
+    """Re-runs on its own every 2s until the worker has stored the metrics."""
+    metrics = job_result(job["job_id"], student_name, ex_id)
+    if metrics is None:
+        st.info("⏳ Scoring your submission…")
+        return
+    job["metrics"] = metrics
+    st.rerun()
 
-        st.success("Submission saved!")
+def show_results(job, ex, my_submissions):
+    metrics = job["metrics"]
+    if not metrics:
+        st.warning("Your submission is saved, but scoring failed. Your instructor can re-grade it.")
+        return
+    student_text, task_type = job["student_text"], job["task_type"]
 
-        # Show metrics neatly
-        def _fmt(v):
-            return "—" if v is None else v
-        st.subheader("Your Metrics")
-        st.markdown(f"""
+    # Show metrics neatly
+    def _fmt(v):
+        return "—" if v is None else v
+    st.subheader("Your Metrics")
+    st.markdown(f"""
 - **Length Ratio** (target/src): {_fmt(metrics['length_ratio'])}
 - **BLEU**: {_fmt(metrics['BLEU'])}
 - **chrF++**: {_fmt(metrics['chrF++'])}
@@ -702,55 +597,55 @@ def student_dashboard():
 - **Additions**: {_fmt(metrics['additions'])}
 - **Deletions**: {_fmt(metrics['deletions'])}
 - **Edits**: {_fmt(metrics['edits'])}
-- **Time Spent**: {round(time_spent, 2)} sec
-- **Characters Typed**: {st.session_state[keys_key]}
+- **Time Spent**: {round(job['time_spent'], 2)} sec
+- **Characters Typed**: {job['chars']}
 """)
 
-        # Adaptive feedback (varied + evidence)
-        extra = quick_linguistic_hints(ex.get("source_text",""), student_text)
-        feedback_msgs = generate_feedback(metrics, task_type, ex.get("source_text",""), student_text, extra)
-        st.subheader("Adaptive Feedback")
-        if feedback_msgs:
-            for m in feedback_msgs:
-                st.markdown(m)
-        else:
-            st.info("No specific issues triggered. Focus on cohesion, clarity, and consistent terminology.")
+    # Adaptive feedback (varied + evidence)
+    extra = quick_linguistic_hints(ex.get("source_text",""), student_text)
+    feedback_msgs = generate_feedback(metrics, task_type, ex.get("source_text",""), student_text, extra)
+    st.subheader("Adaptive Feedback")
+    if feedback_msgs:
+        for m in feedback_msgs:
+            st.markdown(m)
+    else:
+        st.info("No specific issues triggered. Focus on cohesion, clarity, and consistent terminology.")
 
-        if task_type == "Post-edit MT":
-            st.subheader("Track Changes")
-            st.caption("Track changes: green = additions, red strike = deletions.")
-            base = ex.get("mt_text", "") or ""
-            st.markdown(diff_text(base, student_text), unsafe_allow_html=True)
+    if task_type == "Post-edit MT":
+        st.subheader("Track Changes")
+        st.caption("Track changes: green = additions, red strike = deletions.")
+        base = ex.get("mt_text", "") or ""
+        st.markdown(diff_text(base, student_text), unsafe_allow_html=True)
 
-        # Progress mini-dashboard (JSON-based)
-        try:
-            history = []
-            for ex_id2, sub2 in submissions.get(student_name, {}).items():
-                m2 = sub2.get("metrics", {})
-                history.append({
-                    "ex": ex_id2,
-                    "BLEU": m2.get("BLEU"),
-                    "chrF++": m2.get("chrF++"),
-                    "Edits": m2.get("edits", 0)
-                })
-            if history:
-                st.subheader("Progress Overview")
-                df_hist = pd.DataFrame(history)
-                try:
-                    if not df_hist.empty:
-                        df_trend = df_hist.set_index("ex")[["BLEU","chrF++"]]
-                        st.line_chart(df_trend)
-                except Exception:
-                    pass
-                try:
-                    df_edits = df_hist.set_index("ex")[["Edits"]]
-                    st.bar_chart(df_edits)
-                except Exception:
-                    pass
-        except Exception:
-            st.info("Progress charts unavailable.")
+    # Progress mini-dashboard (JSON-based)
+    try:
+        history = []
+        for ex_id2, sub2 in my_submissions.items():
+            m2 = sub2.get("metrics", {})
+            history.append({
+                "ex": ex_id2,
+                "BLEU": m2.get("BLEU"),
+                "chrF++": m2.get("chrF++"),
+                "Edits": m2.get("edits", 0)
+            })
+        if history:
+            st.subheader("Progress Overview")
+            df_hist = pd.DataFrame(history)
+            try:
+                if not df_hist.empty:
+                    df_trend = df_hist.set_index("ex")[["BLEU","chrF++"]]
+                    st.line_chart(df_trend)
+            except Exception:
+                pass
+            try:
+                df_edits = df_hist.set_index("ex")[["Edits"]]
+                st.bar_chart(df_edits)
+            except Exception:
+                pass
+    except Exception:
+        st.info("Progress charts unavailable.")
 
-        show_leaderboard()
+    show_leaderboard()
 
 # ---------------- Main ----------------
 def main():
@@ -763,6 +658,8 @@ def main():
         "<b>EduApp – Build:</b> 2025-11-10 v3 (evidence-based feedback)</div>",
         unsafe_allow_html=True
     )
+    warm_up(models=())  # no reference and no sentence metrics here: nothing to load
+    resume_pending(evaluate_translation, submission_points, _resume_inputs, GRADING_APP)  # once per process
     role = st.sidebar.radio("Login as", ["Instructor", "Student"], index=1)
     if role == "Instructor":
         instructor_dashboard()
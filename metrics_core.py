@@ -0,0 +1,415 @@
+# metrics_core.py — translation metrics shared by main.py and translation_lab.py
+# - evaluate_translation(): one submission (the Submit button)
+# - evaluate_batch(): many submissions at once (re-grading a class after a reference
+#   changes): one BLEU/chrF scorer reused for every pair, one BERTScore call and one
+#   sentence-embedding pass for the whole batch
+# - Sentence embeddings are cached (LRU + data/embeddings/*.npy); exercise texts are
+#   embedded once when the exercise is saved, so a submit only encodes the student text
+# - The BERTScore model is loaded once per process (get_bert_scorer / warm_bert_scorer)
+#   and shared by every session; calls on it are serialized.
+# - Concurrent encode / BERTScore calls (many students submitting at once) are
+#   micro-batched into one forward pass each (batching_core.py, EDUAPP_BATCH_WAIT_MS).
+# - The sentence model runs on fp32 torch, int8 torch or ONNX Runtime per
+#   EDUAPP_EMBED_BACKEND (embedding_core.py).
+# - Both models go through a ModelLoader: load state/duration are exposed (see
+#   warmup_core.py) and a failed load is retried with backoff.
+# - With EDUAPP_MODEL_SERVER set, encoding and BERTScore go to one shared model server
+#   process (serving_core.py) instead; the in-process models are the fallback.
+# All metrics gracefully fall back to None if libs or references are missing.
+
+import os
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import List, Tuple
+from collections import OrderedDict
+
+from storage_core import DATA_DIR
+from diff_core import edit_script  # shared with track changes
+from text_core import analyze_text
+from lazy_core import lazy_import
+from serving_core import configured as model_server_configured, remote_encode, remote_backend, remote_bertscore
+from batching_core import MicroBatcher
+from embedding_core import build_sentence_model, configured_backend
+
+# Optional metrics deps (graceful fallback if missing), imported on first use so that
+# importing this module doesn't pull in torch/transformers (see lazy_core.py)
+BLEU = lazy_import("sacrebleu.metrics", "BLEU")
+CHRF = lazy_import("sacrebleu.metrics", "CHRF")
+BERTScorer = lazy_import("bert_score", "BERTScorer")
+
+# --- Optional deps for sentence-level cosine similarity (safe fallbacks) ---
+np = lazy_import("numpy")
+
+# ---------------- Edit Helpers ----------------
+
+def compute_edit_details(mt_text: str, student_text: str) -> Tuple[int, int, int]:
+    """
+    Token-level edit summary:
+    additions, deletions, total_edits
+    (replace counts as max span length, i.e., single op per replaced region)
+    """
+    _, _, opcodes = edit_script(mt_text, student_text)  # same diff as Track Changes
+
+    additions = deletions = replacements = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "insert":
+            additions += (j2 - j1)
+        elif tag == "delete":
+            deletions += (i2 - i1)
+        elif tag == "replace":
+            replacements += max(i2 - i1, j2 - j1)
+    total_edits = additions + deletions + replacements
+    return additions, deletions, total_edits
+
+# -------- Model loading (once per process, failed loads retried with backoff) --------
+_RETRY_BASE = float(os.getenv("EDUAPP_MODEL_RETRY_SEC", "5"))
+_RETRY_MAX = 300.0
+
+class ModelLoader:
+    """
+    Builds one model per process (thread-safe) and records how that went, for the
+    warm-up thread and readiness probe (warmup_core.py). build() returns the model,
+    None if its library isn't installed (not retried), or raises; a failed load is
+    retried by a later get() once the backoff (EDUAPP_MODEL_RETRY_SEC, doubling up to
+    5 min) has passed, instead of leaving the metric off until a restart.
+    """
+
+    def __init__(self, name: str, build):
+        self.name = name
+        self._build = build
+        self._lock = threading.Lock()
+        self.model = None
+        self.status = "idle"  # idle | loading | ready | failed | unavailable
+        self.attempts = 0
+        self.load_seconds = None
+        self.error = None
+        self.retry_at = 0.0
+
+    def get(self):
+        """The model, or None if it is unavailable or (for now) failed."""
+        if self.model is not None or self.status == "unavailable" or time.monotonic() < self.retry_at:
+            return self.model
+        with self._lock:
+            if self.model is None and self.status != "unavailable" and time.monotonic() >= self.retry_at:
+                self.status, self.attempts = "loading", self.attempts + 1
+                start = time.perf_counter()
+                try:
+                    model = self._build()
+                except Exception as e:
+                    model, self.error = None, f"{type(e).__name__}: {e}"
+                    self.status = "failed"
+                    self.retry_at = time.monotonic() + min(_RETRY_MAX, _RETRY_BASE * 2 ** (self.attempts - 1))
+                else:
+                    self.status = "ready" if model is not None else "unavailable"
+                    self.error = None
+                self.load_seconds = round(time.perf_counter() - start, 3)
+                self.model = model
+        return self.model
+
+    def state(self) -> dict:
+        retry_in = max(0.0, self.retry_at - time.monotonic()) if self.status == "failed" else None
+        return {"model": self.name, "status": self.status, "attempts": self.attempts,
+                "load_seconds": self.load_seconds, "error": self.error,
+                "retry_in": None if retry_in is None else round(retry_in, 1)}
+
+# -------- Sentence-level Cosine Similarity (safe, optional) --------
+_st_model_name = "sentence-transformers/all-MiniLM-L6-v2"  # small & fast
+
+def _build_sentence_model():
+    return build_sentence_model(_st_model_name)  # fp32 / int8 / ONNX per EDUAPP_EMBED_BACKEND
+
+sentence_loader = ModelLoader("sentence", _build_sentence_model)
+
+def get_sentence_model():
+    """Load sentence-transformer once; return None if unavailable/fails (retried later)."""
+    return sentence_loader.get()
+
+def _cosine(u, v):
+    """Manual cosine similarity; returns None on any issue."""
+    try:
+        if np.get() is None:
+            return None
+        u = np.asarray(u, dtype=float)
+        v = np.asarray(v, dtype=float)
+        nu = np.linalg.norm(u)
+        nv = np.linalg.norm(v)
+        if nu == 0.0 or nv == 0.0:
+            return None
+        return float(np.dot(u, v) / (nu * nv))
+    except Exception:
+        return None
+
+# -------- Embedding cache (LRU in memory + .npy files on disk) --------
+# Keyed on SHA-1 of (model name, backend that produced the vector, text). Exercise texts (source/reference) are the same
+# for every student, so they are persisted to disk and encoded once per exercise;
+# student texts only go through the in-memory LRU.
+EMBED_DIR = DATA_DIR / "embeddings"
+_EMB_LRU_SIZE = 2048
+_emb_lru = OrderedDict()
+_emb_lock = threading.Lock()
+
+def _emb_key(text: str, backend: str) -> str:
+    model = _st_model_name if backend == "torch" else f"{_st_model_name}|{backend}"  # backends differ slightly
+    return hashlib.sha1(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+def _emb_path(key: str) -> Path:
+    return EMBED_DIR / key[:2] / f"{key}.npy"
+
+def _emb_get(key: str):
+    with _emb_lock:
+        if key in _emb_lru:
+            _emb_lru.move_to_end(key)
+            return _emb_lru[key]
+    try:
+        vec = np.load(_emb_path(key))
+    except Exception:
+        return None
+    _emb_remember(key, vec)
+    return vec
+
+def _emb_remember(key: str, vec):
+    with _emb_lock:
+        _emb_lru[key] = vec
+        _emb_lru.move_to_end(key)
+        while len(_emb_lru) > _EMB_LRU_SIZE:
+            _emb_lru.popitem(last=False)
+
+def _emb_persist(key: str, vec):
+    try:
+        path = _emb_path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp.npy")
+        np.save(tmp, np.asarray(vec))
+        tmp.replace(path)
+    except Exception:
+        pass  # the cache is an optimization only
+
+def embed_texts(texts: List[str], persist: bool = False) -> dict:
+    """
+    {text: embedding} for the distinct texts; cached ones are not re-encoded,
+    the rest go through one batched encode. persist=True also writes them to disk.
+    Returns {} if the model is unavailable.
+    """
+    if np.get() is None:
+        return {}
+    backend = remote_backend() or configured_backend()  # whose vectors an encode gives now
+    uniq = list(dict.fromkeys(t or "" for t in texts))
+    out, missing = {}, []
+    for t in uniq:
+        vec = _emb_get(_emb_key(t, backend))
+        if vec is None:
+            missing.append(t)
+        else:
+            out[t] = vec
+    if missing:
+        try:
+            embs, produced = _encode_any(missing)
+            if embs is not None and produced != backend and out:
+                # the server is down or switched backends: don't compare its vectors with ours
+                out, missing = {}, uniq
+                embs, produced = _encode_any(missing)
+            if embs is None:
+                return out
+        except Exception:
+            return out
+        for t, vec in zip(missing, embs):
+            key = _emb_key(t, produced)
+            _emb_remember(key, vec)
+            if persist:
+                _emb_persist(key, vec)
+            out[t] = vec
+    elif persist:
+        for t in uniq:
+            _emb_persist(_emb_key(t, backend), out[t])
+    return out
+
+def _encode_any(texts: List[str]):
+    """(embeddings, backend that produced them): from the model server if configured, else this process."""
+    remote = remote_encode(texts)
+    if remote is not None:
+        embs, backend = remote
+        return np.asarray(embs, dtype=np.float32), backend
+    return encode_local(texts), configured_backend()
+
+def _encode_batch(texts: List[str]):
+    model = get_sentence_model()
+    if model is None:
+        return None
+    # one forward pass per batcher batch; an oversized request (a bulk re-grade) is chunked
+    return model.encode(texts, batch_size=min(len(texts), _encode_batcher.max_items), normalize_embeddings=False)
+
+_encode_batcher = MicroBatcher("encode", _encode_batch)
+
+def encode_local(texts: List[str]):
+    """Embeddings from this process's sentence model, or None if unavailable. Concurrent
+    calls are coalesced into one forward pass (batching_core)."""
+    return _encode_batcher.run(texts)
+
+def precompute_exercise_embeddings(*texts: str):
+    """Encode and persist an exercise's source/reference in the background (on save)."""
+    texts = [t for t in texts if t]
+    if texts:
+        threading.Thread(target=embed_texts, args=(texts, True), name="exercise-embeddings", daemon=True).start()
+
+def sentence_cosine(a: str, b: str) -> float | None:
+    """Cosine similarity in [-1,1] between sentence embeddings, or None."""
+    try:
+        embs = embed_texts([a or "", b or ""])
+        if not embs:
+            return None
+        return _cosine(embs.get(a or ""), embs.get(b or ""))
+    except Exception:
+        return None
+
+# -------- BERTScore (one long-lived scorer per process) --------
+_bert_lang = "en"
+_bert_lock = threading.Lock()  # one forward pass at a time on the shared model
+
+def _build_bert_scorer():
+    return BERTScorer(lang=_bert_lang) if BERTScorer.get() is not None else None
+
+bert_loader = ModelLoader("bertscore", _build_bert_scorer)
+
+def get_bert_scorer():
+    """Build BERTScorer once (thread-safe); return None if unavailable/fails (retried later)."""
+    return bert_loader.get()
+
+def warm_bert_scorer():
+    """Load the BERTScore model in a daemon thread so the first submit doesn't pay for it."""
+    if bert_loader.status == "idle":
+        threading.Thread(target=get_bert_scorer, name="bertscore-warmup", daemon=True).start()
+
+def bertscore_f1(cands: List[str], refs: List[str]) -> List[float] | None:
+    """F1 per (candidate, reference) pair on the model server if configured, else in-process, or None."""
+    f1 = remote_bertscore(cands, refs)
+    return f1 if f1 is not None else bertscore_local(cands, refs)
+
+def _bertscore_batch(pairs: List[Tuple[str, str]]):
+    scorer = get_bert_scorer()
+    if scorer is None:
+        return None
+    with _bert_lock:
+        P, R, F1 = scorer.score([c for c, _ in pairs], [r for _, r in pairs])
+    return [float(f) for f in F1.tolist()]
+
+_bert_batcher = MicroBatcher("bertscore", _bertscore_batch)
+
+def bertscore_local(cands: List[str], refs: List[str]) -> List[float] | None:
+    """F1 per (candidate, reference) pair on this process's shared scorer, or None.
+    Concurrent calls are coalesced into one forward pass (batching_core)."""
+    return _bert_batcher.run(list(zip(cands, refs)))
+
+# ---------------- Metrics ----------------
+def _r(v, nd):
+    return None if v is None else round(v, nd)
+
+def evaluate_batch(records, sentence_metrics: bool = True) -> List[dict]:
+    """
+    Score many submissions in one go. Each record is a dict with the arguments of
+    evaluate_translation: student_text, mt_text, reference, task_type, source_text.
+    Returns one metrics dict per record, in order, identical to evaluate_translation.
+    """
+    records = [dict(r) for r in records]
+    for r in records:
+        r["student_text"] = r.get("student_text") or ""
+        r["source_text"] = r.get("source_text") or ""
+
+    n = len(records)
+    bleu = [None] * n
+    chrf = [None] * n
+    bert_f1 = [None] * n
+    cos_ref = [None] * n
+    cos_src = [None] * n
+    with_ref = [i for i, r in enumerate(records) if r.get("reference")]
+
+    # BLEU / chrF++: one scorer object reused for every pair (0-100)
+    if with_ref and BLEU.get() is not None:
+        try:
+            bleu_metric, chrf_metric = BLEU(), CHRF()
+            for i in with_ref:
+                hyp, refs = [records[i]["student_text"]], [[records[i]["reference"]]]
+                try:
+                    bleu[i] = float(bleu_metric.corpus_score(hyp, refs).score)
+                    chrf[i] = float(chrf_metric.corpus_score(hyp, refs).score)
+                except Exception:
+                    bleu[i] = chrf[i] = None
+        except Exception:
+            pass
+
+    # BERTScore: one call on the shared scorer (batched forward passes) for the batch (0-1);
+    # with a model server, bert_score (torch, transformers) is never imported here
+    if with_ref and (model_server_configured() or BERTScorer.available()):
+        try:
+            f1s = bertscore_f1([records[i]["student_text"] for i in with_ref],
+                               [records[i]["reference"] for i in with_ref])
+            for i, f in zip(with_ref, f1s or []):
+                bert_f1[i] = f
+        except Exception:
+            pass
+
+    # Sentence-level cosine similarities: every distinct text encoded at most once;
+    # exercise-side texts usually come straight from the embedding cache
+    if sentence_metrics:
+        student_texts, exercise_texts = [], []
+        for r in records:
+            if r.get("reference") or r["source_text"]:
+                student_texts.append(r["student_text"])
+            if r.get("reference"):
+                exercise_texts.append(r["reference"])
+            if r["source_text"]:
+                exercise_texts.append(r["source_text"])
+        embs = embed_texts(exercise_texts, persist=True) if exercise_texts else {}
+        if embs:
+            embs.update(embed_texts(student_texts))
+            for i, r in enumerate(records):
+                if r.get("reference"):
+                    cos_ref[i] = _cosine(embs.get(r["student_text"]), embs.get(r["reference"]))
+                if r["source_text"]:
+                    cos_src[i] = _cosine(embs.get(r["student_text"]), embs.get(r["source_text"]))
+
+    out = []
+    for i, r in enumerate(records):
+        src_len = max(1, len(analyze_text(r["source_text"]).tokens))
+        tgt_len = len(analyze_text(r["student_text"]).tokens)
+        if r.get("task_type", "Translate") == "Post-edit MT" and r.get("mt_text"):
+            additions, deletions, edits = compute_edit_details(r["mt_text"], r["student_text"])
+        else:
+            additions = deletions = edits = 0
+
+        m = {
+            "length_ratio": round(tgt_len / src_len, 3),
+            "BLEU": _r(bleu[i], 2),
+            "chrF++": _r(chrf[i], 2),
+            "BERTScore_F1": _r(bert_f1[i], 3),
+        }
+        if sentence_metrics:
+            m["SentenceCosine_Ref"] = _r(cos_ref[i], 3)
+            m["SentenceCosine_Source"] = _r(cos_src[i], 3)
+        m.update({"additions": additions, "deletions": deletions, "edits": edits})
+        out.append(m)
+    return out
+
+def evaluate_translation(student_text, mt_text=None, reference=None, task_type="Translate", source_text="",
+                         sentence_metrics: bool = True):
+    """
+    Returns a metrics dict using:
+      - length_ratio (target tokens / source tokens)
+      - BLEU (sacrebleu, if reference provided)
+      - chrF++ (sacrebleu, if reference provided)
+      - BERTScore_F1 (if available & reference provided)
+      - sentence-level cosine similarities (candidate vs reference & vs source),
+        unless sentence_metrics=False
+      - edit counts for post-edit tasks
+    All metrics gracefully fallback to None if libs or references are missing.
+    """
+    return evaluate_batch([{
+        "student_text": student_text,
+        "mt_text": mt_text,
+        "reference": reference,
+        "task_type": task_type,
+        "source_text": source_text,
+    }], sentence_metrics=sentence_metrics)[0]
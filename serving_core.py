@@ -0,0 +1,193 @@
+# serving_core.py — optional shared model server for multi-replica deployments
+# Every app/grading process used to hold its own copy of the sentence-transformer and
+# BERTScore weights. Run one model server per host instead:
+#     python serving_core.py serve --socket /tmp/eduapp-models.sock   (or --port 8765)
+# and point the apps at it with EDUAPP_MODEL_SERVER=unix:/tmp/eduapp-models.sock
+# (or http://127.0.0.1:8765). metrics_core then sends batched encode / BERTScore
+# requests to it (remote_encode / remote_bertscore) and never loads the models
+# itself; if the server can't be reached, it falls back to the in-process models and
+# leaves the server alone for EDUAPP_MODEL_SERVER_RETRY_SEC (default 30).
+# Endpoints (JSON): POST /encode {"texts"} -> {"embeddings", "backend"} (the server's
+# EDUAPP_EMBED_BACKEND, so clients cache its vectors under it); POST /bertscore
+# {"cands", "refs"} -> {"f1"}; GET /healthz, GET /readyz as in warmup_core.py.
+# Stdlib only on the client side, so importing this module costs nothing.
+
+import os
+import json
+import time
+import socket
+import argparse
+import socketserver
+import threading
+import http.client
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_serving = False  # True inside the server process: never call ourselves
+_local = threading.local()  # one keep-alive connection per client thread
+_down_until = 0.0
+_backend = None  # embedding backend of the server's last /encode reply
+
+def _address() -> str:
+    return "" if _serving else os.getenv("EDUAPP_MODEL_SERVER", "").strip()
+
+def configured() -> bool:
+    """Whether this process should use the model server rather than its own models."""
+    return bool(_address())
+
+# ---------------- Client ----------------
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+def _connection(address: str):
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "address", None) != address:
+        timeout = float(os.getenv("EDUAPP_MODEL_SERVER_TIMEOUT", "60"))
+        if address.startswith("unix:"):
+            conn = _UnixConnection(address[len("unix:"):], timeout)
+        else:
+            url = urlparse(address if "://" in address else f"http://{address}")
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+        _local.conn, _local.address = conn, address
+    return conn
+
+def _call(path: str, payload: dict | None = None, ok=(200,)):
+    """POST payload (GET if None) to the model server; the decoded reply, or None (not configured / down)."""
+    global _down_until
+    address = _address()
+    if not address or time.monotonic() < _down_until:
+        return None
+    body = None if payload is None else json.dumps(payload).encode("utf-8")
+    for attempt in range(2):  # a kept-alive connection may have been closed by the server
+        conn = _connection(address)
+        try:
+            conn.request("GET" if body is None else "POST", path, body, {"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            data = resp.read()
+            if resp.status not in ok:
+                raise OSError(f"model server returned {resp.status}")
+            return json.loads(data)
+        except (OSError, http.client.HTTPException, ValueError):
+            conn.close()
+            _local.conn = None
+            if attempt:
+                _down_until = time.monotonic() + float(os.getenv("EDUAPP_MODEL_SERVER_RETRY_SEC", "30"))
+    return None
+
+def remote_encode(texts):
+    """(sentence embeddings as float lists, backend that produced them) from the model server, or None."""
+    global _backend
+    reply = _call("/encode", {"texts": list(texts)})
+    if reply is None or reply.get("embeddings") is None:
+        return None
+    _backend = reply.get("backend", "torch")
+    return reply["embeddings"], _backend
+
+def remote_backend():
+    """The model server's embedding backend as last reported, or None (no server / no reply yet)."""
+    return _backend if configured() else None
+
+def remote_bertscore(cands, refs):
+    """BERTScore F1 per pair from the model server, or None."""
+    reply = _call("/bertscore", {"cands": list(cands), "refs": list(refs)})
+    return None if reply is None else reply.get("f1")
+
+def remote_status():
+    """The model server's /readyz body, or None if it can't be reached."""
+    return _call("/readyz", ok=(200, 503))
+
+# ---------------- Server ----------------
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive for the per-thread client connections
+
+    def _reply(self, code: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        from warmup_core import status
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/healthz":
+            self._reply(200, {"alive": True})
+        elif path == "/readyz":
+            body = status()
+            self._reply(200 if body["ready"] else 503, body)
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        from metrics_core import encode_local, bertscore_local
+        from embedding_core import configured_backend
+        try:
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            path = self.path.split("?")[0].rstrip("/")
+            if path == "/encode":
+                embs = encode_local(req["texts"])
+                body = {"embeddings": None if embs is None else [[float(x) for x in v] for v in embs],
+                        "backend": configured_backend()}
+            elif path == "/bertscore":
+                body = {"f1": bertscore_local(req["cands"], req["refs"])}
+            else:
+                return self._reply(404, {"error": "not found"})
+        except Exception as e:
+            return self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+        self._reply(200, body)
+
+    def address_string(self):
+        return "local"  # unix sockets have no peer address
+
+    def log_message(self, *args):
+        pass
+
+class _UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        socketserver.TCPServer.server_bind(self)  # HTTPServer's version expects (host, port)
+        self.server_name, self.server_port = "localhost", 0
+
+def serve(socket_path: str | None = None, port: int | None = None, host: str = "127.0.0.1"):
+    """Load the models once (warmup_core) and serve them until interrupted."""
+    global _serving
+    _serving = True
+    import warmup_core
+    warmup_core.start()
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # left over from a previous run
+        server = _UnixHTTPServer(socket_path, _Handler)
+    else:
+        server = ThreadingHTTPServer((host, port or 8765), _Handler)
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="EduApp shared model server")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sv = sub.add_parser("serve", help="hold one copy of the metric models and serve them")
+    sv.add_argument("--socket", default=None, help="Unix socket path (EDUAPP_MODEL_SERVER=unix:<path>)")
+    sv.add_argument("--port", type=int, default=None, help="TCP port on --host (default 8765)")
+    sv.add_argument("--host", default="127.0.0.1")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "serve":
+        serve(args.socket, args.port, args.host)
+
+if __name__ == "__main__":
+    main()
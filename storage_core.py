@@ -0,0 +1,806 @@
+# storage_core.py — pluggable storage shared by main.py and translation_lab.py
+# - "json"   : the original ./data/*.json files (default, no migration needed)
+# - "journal": same JSON files, but submits/points are appended to a journal and compacted later
+# - "sharded": one submissions file per student + a small manifest (data/submissions/)
+# - "sqlite" : one embedded SQLite file (WAL), one row per submission, per-row upserts
+# Select the backend with EDUAPP_STORAGE=json|journal|sharded|sqlite.
+# Migrate existing JSON data once with:  python storage_core.py migrate
+# JSON/journal writes take an fcntl lock on <file>.lock, so several app processes
+# (e.g. Streamlit replicas) can share one ./data volume.
+
+import os
+import re
+import sys
+import copy
+import json
+import hashlib
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# ---------------- Locations ----------------
+DATA_DIR = Path(os.getenv("EDUAPP_DATA_DIR", "./data"))
+DATA_DIR.mkdir(exist_ok=True)
+
+EXERCISES_FILE = DATA_DIR / "exercises.json"
+SUBMISSIONS_FILE = DATA_DIR / "submissions.json"
+LEADERBOARD_FILE = DATA_DIR / "leaderboard.json"
+SQLITE_FILE = DATA_DIR / "eduapp.sqlite3"
+
+def _is(file, target: Path) -> bool:
+    return Path(file).name == target.name
+
+# ---------------- Interface ----------------
+class Storage:
+    """
+    What the dashboards need from a backend.
+    load/save keep the old whole-document semantics (dict in, dict out);
+    load(..., readonly=True) may return a shared object the caller must not mutate;
+    the row-level helpers let hot paths (a student submit, a points update)
+    touch only the entry that changed. Backends override what they can do better.
+    """
+
+    def load(self, file: Path, readonly: bool = False) -> dict:
+        raise NotImplementedError
+
+    def save(self, file: Path, data: dict):
+        raise NotImplementedError
+
+    def student_submissions(self, student: str) -> dict:
+        return copy.deepcopy(self.load(SUBMISSIONS_FILE, readonly=True).get(student, {}))
+
+    def put_submission(self, student: str, ex_id: str, sub: dict):
+        submissions = self.load(SUBMISSIONS_FILE)
+        submissions.setdefault(student, {})[ex_id] = sub
+        self.save(SUBMISSIONS_FILE, submissions)
+
+    def update_submission(self, student: str, ex_id: str, mutate):
+        """
+        Read-modify-write of one stored submission: mutate(current or None) returns
+        the new record, or None to leave it alone. Returns what was written (or None).
+        """
+        sub = mutate(self.student_submissions(student).get(ex_id))
+        if sub is not None:
+            self.put_submission(student, ex_id, sub)
+        return sub
+
+    def update_submissions(self, mutations: dict) -> set:
+        """
+        update_submission for many records: {(student, ex_id): mutate}. Returns the
+        keys that were written. Backends override this to do it in one write.
+        """
+        return {key for key, mutate in mutations.items() if self.update_submission(*key, mutate) is not None}
+
+    def add_points(self, student: str, points: int):
+        leaderboard = self.load(LEADERBOARD_FILE)
+        leaderboard[student] = leaderboard.get(student, 0) + points
+        self.save(LEADERBOARD_FILE, leaderboard)
+
+    def iter_submissions(self):
+        """Yield (student, ex_id, submission) for the whole class (read-only)."""
+        for student, subs in self.load(SUBMISSIONS_FILE, readonly=True).items():
+            for ex_id, sub in subs.items():
+                yield student, ex_id, sub
+
+    def students(self) -> list:
+        return list(self.load(SUBMISSIONS_FILE, readonly=True).keys())
+
+# ---------------- Cross-process locking ----------------
+try:
+    import fcntl  # POSIX only; elsewhere we fall back to the in-process lock
+except ImportError:
+    fcntl = None
+
+@contextmanager
+def _file_lock(file: Path, shared: bool = False):
+    """Advisory lock on <file>.lock shared by every process using the same ./data volume."""
+    if fcntl is None:
+        yield
+        return
+    with open(str(file) + ".lock", "a+") as fh:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+def _stamp(file: Path):
+    """Version of a file on disk: (inode, mtime_ns, size), or None if missing."""
+    try:
+        s = os.stat(file)
+    except FileNotFoundError:
+        return None
+    return (s.st_ino, s.st_mtime_ns, s.st_size)
+
+# ---------------- JSON files (original layout) ----------------
+class JSONStorage(Storage):
+    def __init__(self, retries: int = 3):
+        self._lock = threading.Lock()
+        self.retries = retries
+        self._cache = {}  # abs path -> (stamp, parsed data)
+
+    def load(self, file: Path, readonly: bool = False) -> dict:
+        """
+        Each on-disk version is parsed once: the cache is keyed on the file's
+        (inode, mtime_ns, size) stamp, so an idle Streamlit rerun costs one stat().
+        readonly=True hands out the shared cached dict; otherwise a private deep copy.
+        """
+        file = Path(file)
+        stamp = _stamp(file)
+        if stamp is None:
+            return {}
+        key = os.path.abspath(file)
+        hit = self._cache.get(key)
+        if hit is None or hit[0] != stamp:
+            hit = (stamp, self._read(file))
+            self._cache[key] = hit
+        return hit[1] if readonly else copy.deepcopy(hit[1])
+
+    @staticmethod
+    def _read(file: Path) -> dict:
+        """Parse without touching the cache."""
+        try:
+            with Path(file).open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            # If a previous run got interrupted; return empty dict rather than crashing
+            return {}
+
+    def save(self, file: Path, data: dict):
+        with self._lock, _file_lock(file):
+            self._write(file, data)
+
+    def _write(self, file: Path, data: dict):
+        """Atomic replace; caller holds both locks."""
+        tmp = Path(str(file) + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        tmp.replace(file)
+        self._cache.pop(os.path.abspath(file), None)
+
+    def update(self, file: Path, mutate) -> dict:
+        """
+        Read-modify-write that doesn't lose other processes' changes.
+        mutate(data) is applied to a fresh load without holding the lock; the result
+        is only written if the file's stamp is unchanged, otherwise mutate is re-run
+        on the newer data (so both changes survive). After `retries` conflicts the
+        whole cycle runs under the lock.
+        """
+        for _ in range(self.retries):
+            before = _stamp(file)
+            data = self.load(file)
+            mutate(data)
+            with self._lock, _file_lock(file):
+                if _stamp(file) == before:
+                    self._write(file, data)
+                    return data
+        with self._lock, _file_lock(file):
+            data = self.load(file)
+            mutate(data)
+            self._write(file, data)
+            return data
+
+    def put_submission(self, student: str, ex_id: str, sub: dict):
+        def _put(submissions):
+            submissions.setdefault(student, {})[ex_id] = sub
+        self.update(SUBMISSIONS_FILE, _put)
+
+    def update_submission(self, student: str, ex_id: str, mutate):
+        out = []
+
+        def _mut(submissions):
+            out[:] = [mutate(copy.deepcopy(submissions.get(student, {}).get(ex_id)))]
+            if out[0] is not None:
+                submissions.setdefault(student, {})[ex_id] = out[0]
+        self.update(SUBMISSIONS_FILE, _mut)
+        return out[0]
+
+    def update_submissions(self, mutations: dict) -> set:
+        written = set()
+
+        def _mut(submissions):
+            written.clear()  # update() may re-run us on newer data
+            for (student, ex_id), mutate in mutations.items():
+                sub = mutate(copy.deepcopy(submissions.get(student, {}).get(ex_id)))
+                if sub is not None:
+                    submissions.setdefault(student, {})[ex_id] = sub
+                    written.add((student, ex_id))
+        self.update(SUBMISSIONS_FILE, _mut)
+        return written
+
+    def add_points(self, student: str, points: int):
+        def _add(leaderboard):
+            leaderboard[student] = leaderboard.get(student, 0) + points
+        self.update(LEADERBOARD_FILE, _add)
+
+# ---------------- JSON snapshot + append-only journal ----------------
+class JournalStorage(JSONStorage):
+    """
+    Same data/*.json layout, but submissions and leaderboard updates are appended
+    as one JSON line to <file>.journal instead of rewriting the whole document.
+    Readers see snapshot + replayed journal; new lines are folded into a fresh
+    dict, so what load(readonly=True) handed out never changes under its reader.
+    Once a journal passes EDUAPP_JOURNAL_MAX_BYTES (default 1 MB) a background
+    thread folds it into the snapshot and starts a fresh journal.
+
+    Journal ops are idempotent ("put" a submission, "set" a student's total),
+    so a crash between writing the snapshot and resetting the journal only
+    replays entries that are already in the snapshot. A torn last line from a
+    crash mid-append is skipped on replay. Appends and compaction hold the
+    <file>.lock file lock, so several processes can share one journal; a
+    compaction done elsewhere is noticed by the snapshot/journal stamps changing.
+    """
+    JOURNALED = (SUBMISSIONS_FILE.name, LEADERBOARD_FILE.name)
+
+    def __init__(self, max_bytes: int | None = None):
+        super().__init__()
+        self._lock = threading.RLock()
+        self.max_bytes = max_bytes or int(os.getenv("EDUAPP_JOURNAL_MAX_BYTES", "1000000"))
+        self._state = {}       # file name -> folded dict (snapshot + journal)
+        self._offset = {}      # file name -> journal bytes already applied
+        self._gen = {}         # file name -> (snapshot stamp, journal inode) we replayed
+        self._compacting = set()
+
+    @staticmethod
+    def _journal(file: Path) -> Path:
+        return Path(str(file) + ".journal")
+
+    @staticmethod
+    def _fold(state: dict, ops) -> dict:
+        """
+        state with ops applied, as a new dict: a published state may be in a reader's
+        hands (load(readonly=True)), so it is never changed in place. Only the top
+        level and the students the ops touch are copied.
+        """
+        new, copied = dict(state), set()
+        for op in ops:
+            try:
+                if op.get("op") == "put":
+                    student = op["student"]
+                    if student not in copied:
+                        new[student] = dict(new.get(student, {}))
+                        copied.add(student)
+                    new[student][op["ex_id"]] = op["sub"]
+                elif op.get("op") == "set":
+                    new[op["student"]] = op["points"]
+            except (KeyError, TypeError, AttributeError):
+                continue  # garbled line from a crash
+        return new
+
+    def _refresh(self, file: Path) -> dict:
+        """Fold any journal lines not yet applied; caller holds the locks."""
+        name = Path(file).name
+        journal = self._journal(file)
+        stamp = _stamp(journal)
+        size = stamp[2] if stamp else 0
+        gen = (_stamp(file), stamp[0] if stamp else None)
+        if name not in self._state or gen != self._gen.get(name) or size < self._offset[name]:
+            # first use, or the snapshot/journal was compacted or reset by someone else
+            self._state[name] = super().load(file)
+            self._offset[name] = 0
+            self._gen[name] = gen
+        if size > self._offset[name]:
+            with journal.open("rb") as f:
+                f.seek(self._offset[name])
+                chunk = f.read(size - self._offset[name])
+            done = chunk.rfind(b"\n") + 1  # only whole lines; a torn tail waits
+            ops = []
+            for line in chunk[:done].splitlines():
+                try:
+                    ops.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # torn line from a crash
+            if ops:
+                self._state[name] = self._fold(self._state[name], ops)
+            self._offset[name] += done
+        return self._state[name]
+
+    def _append(self, file: Path, op: dict):
+        """Append one op and fold it in; caller holds the locks (and has refreshed)."""
+        name = Path(file).name
+        journal = self._journal(file)
+        line = json.dumps(op, ensure_ascii=False).encode("utf-8") + b"\n"
+        with journal.open("ab") as f:
+            if f.tell() > self._offset[name]:
+                line = b"\n" + line  # isolate a torn tail left by a crash
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            self._offset[name] = f.tell()
+            self._gen[name] = (_stamp(file), os.fstat(f.fileno()).st_ino)
+        self._state[name] = self._fold(self._state[name], [op])
+        if self._offset[name] > self.max_bytes and name not in self._compacting:
+            self._compacting.add(name)
+            threading.Thread(target=self.compact, args=(file,), daemon=True).start()
+
+    def _reset_journal(self, file: Path):
+        """Swap in an empty journal (new inode, so other processes reload)."""
+        name = Path(file).name
+        journal = self._journal(file)
+        tmp = Path(str(journal) + ".tmp")
+        with tmp.open("wb"):
+            pass
+        tmp.replace(journal)
+        self._offset[name] = 0
+        self._gen[name] = (_stamp(file), _stamp(journal)[0])
+
+    def compact(self, file: Path):
+        """Fold the journal into the snapshot and start a fresh journal."""
+        try:
+            with self._lock, _file_lock(file):
+                self._write(file, self._refresh(file))
+                self._reset_journal(file)
+        finally:
+            self._compacting.discard(Path(file).name)
+
+    def load(self, file: Path, readonly: bool = False) -> dict:
+        if Path(file).name not in self.JOURNALED:
+            return super().load(file, readonly)
+        with self._lock, _file_lock(file, shared=True):
+            state = self._refresh(file)
+            return state if readonly else copy.deepcopy(state)
+
+    def save(self, file: Path, data: dict):
+        if Path(file).name not in self.JOURNALED:
+            return super().save(file, data)
+        with self._lock, _file_lock(file):
+            self._write(file, data)
+            self._reset_journal(file)
+            self._state[Path(file).name] = copy.deepcopy(data)
+
+    def student_submissions(self, student: str) -> dict:
+        with self._lock, _file_lock(SUBMISSIONS_FILE, shared=True):
+            return copy.deepcopy(self._refresh(SUBMISSIONS_FILE).get(student, {}))
+
+    def put_submission(self, student: str, ex_id: str, sub: dict):
+        with self._lock, _file_lock(SUBMISSIONS_FILE):
+            self._refresh(SUBMISSIONS_FILE)
+            self._append(SUBMISSIONS_FILE, {"op": "put", "student": student, "ex_id": ex_id, "sub": sub})
+
+    def update_submission(self, student: str, ex_id: str, mutate):
+        with self._lock, _file_lock(SUBMISSIONS_FILE):
+            current = self._refresh(SUBMISSIONS_FILE).get(student, {}).get(ex_id)
+            sub = mutate(copy.deepcopy(current))
+            if sub is not None:
+                self._append(SUBMISSIONS_FILE, {"op": "put", "student": student, "ex_id": ex_id, "sub": sub})
+            return sub
+
+    def update_submissions(self, mutations: dict) -> set:
+        written = set()
+        with self._lock, _file_lock(SUBMISSIONS_FILE):
+            state = self._refresh(SUBMISSIONS_FILE)
+            for (student, ex_id), mutate in mutations.items():
+                sub = mutate(copy.deepcopy(state.get(student, {}).get(ex_id)))
+                if sub is not None:
+                    self._append(SUBMISSIONS_FILE, {"op": "put", "student": student, "ex_id": ex_id, "sub": sub})
+                    written.add((student, ex_id))
+        return written
+
+    def add_points(self, student: str, points: int):
+        with self._lock, _file_lock(LEADERBOARD_FILE):
+            total = self._refresh(LEADERBOARD_FILE).get(student, 0) + points
+            self._append(LEADERBOARD_FILE, {"op": "set", "student": student, "points": total})
+
+    def iter_submissions(self):
+        with self._lock, _file_lock(SUBMISSIONS_FILE, shared=True):
+            state = copy.deepcopy(self._refresh(SUBMISSIONS_FILE))
+        for student, subs in state.items():
+            for ex_id, sub in subs.items():
+                yield student, ex_id, sub
+
+# ---------------- One JSON shard per student ----------------
+class ShardedStorage(JSONStorage):
+    """
+    submissions.json is split into data/submissions/<student>-<hash>.json plus a
+    small manifest data/submissions/index.json (student -> shard file name).
+    A student's page reads and writes only its own shard; class-wide views
+    (exports, snapshot) stream the shards one at a time without caching them.
+    Exercises and the leaderboard stay plain JSON files.
+    On first use an existing single submissions.json is split automatically.
+    """
+
+    def __init__(self, shard_dir: Path | None = None):
+        super().__init__()
+        self.shard_dir = Path(shard_dir or DATA_DIR / "submissions")
+        self.shard_dir.mkdir(exist_ok=True)
+        self.index_file = self.shard_dir / "index.json"
+        if not self.index_file.exists() and SUBMISSIONS_FILE.exists():
+            self.save(SUBMISSIONS_FILE, JournalStorage().load(SUBMISSIONS_FILE))
+
+    @staticmethod
+    def _shard_name(student: str) -> str:
+        slug = re.sub(r"[^\w\-]+", "_", student)[:40]
+        return f"{slug}-{hashlib.sha1(student.encode('utf-8')).hexdigest()[:10]}.json"
+
+    def _index(self) -> dict:
+        return JSONStorage.load(self, self.index_file, readonly=True)
+
+    def students(self) -> list:
+        return list(self._index().keys())
+
+    def load(self, file: Path, readonly: bool = False) -> dict:
+        if not _is(file, SUBMISSIONS_FILE):
+            return super().load(file, readonly)
+        return {student: JSONStorage.load(self, self.shard_dir / name, readonly)
+                for student, name in self._index().items()}
+
+    def save(self, file: Path, data: dict):
+        if not _is(file, SUBMISSIONS_FILE):
+            return super().save(file, data)
+        index = {}
+        for student, subs in data.items():
+            shard = self.shard_dir / self._shard_name(student)
+            super().save(shard, subs)
+            index[student] = shard.name
+        for student, name in self._index().items():
+            if student not in index:
+                (self.shard_dir / name).unlink(missing_ok=True)
+        super().save(self.index_file, index)
+
+    def student_submissions(self, student: str) -> dict:
+        name = self._index().get(student)
+        return super().load(self.shard_dir / name) if name else {}
+
+    def put_submission(self, student: str, ex_id: str, sub: dict):
+        shard = self.shard_dir / self._shard_name(student)
+
+        def _put(subs):
+            subs[ex_id] = sub
+        self.update(shard, _put)
+
+        if student not in self._index():
+            def _register(index):
+                index.setdefault(student, shard.name)
+            self.update(self.index_file, _register)
+
+    def update_submission(self, student: str, ex_id: str, mutate):
+        shard = self.shard_dir / self._shard_name(student)
+        out = []
+
+        def _mut(subs):
+            out[:] = [mutate(copy.deepcopy(subs.get(ex_id)))]
+            if out[0] is not None:
+                subs[ex_id] = out[0]
+        self.update(shard, _mut)
+
+        if out[0] is not None and student not in self._index():
+            def _register(index):
+                index.setdefault(student, shard.name)
+            self.update(self.index_file, _register)
+        return out[0]
+
+    def update_submissions(self, mutations: dict) -> set:
+        by_student = {}
+        for (student, ex_id), mutate in mutations.items():
+            by_student.setdefault(student, {})[ex_id] = mutate
+        written = set()
+        for student, muts in by_student.items():  # one shard write per student
+            shard = self.shard_dir / self._shard_name(student)
+            done = set()
+
+            def _mut(subs):
+                done.clear()
+                for ex_id, mutate in muts.items():
+                    sub = mutate(copy.deepcopy(subs.get(ex_id)))
+                    if sub is not None:
+                        subs[ex_id] = sub
+                        done.add((student, ex_id))
+            if student not in self._index():
+                continue  # nothing stored for this student; don't create a shard
+            self.update(shard, _mut)
+            written |= done
+        return written
+
+    def iter_submissions(self):
+        for student, name in list(self._index().items()):
+            for ex_id, sub in self._read(self.shard_dir / name).items():
+                yield student, ex_id, sub
+
+# ---------------- SQLite (WAL, row per submission) ----------------
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    student TEXT NOT NULL,
+    ex_id   TEXT NOT NULL,
+    data    TEXT NOT NULL,
+    PRIMARY KEY (student, ex_id)
+);
+CREATE TABLE IF NOT EXISTS leaderboard (
+    student TEXT PRIMARY KEY,
+    points  INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+class SQLiteStorage(Storage):
+    """
+    submissions.json -> table `submissions` (one row per student/exercise)
+    leaderboard.json -> table `leaderboard` (one row per student)
+    anything else    -> table `documents` (one JSON blob per file name, e.g. exercises)
+    """
+
+    def __init__(self, db_path: Path = SQLITE_FILE):
+        self.db_path = Path(db_path)
+        self._local = threading.local()  # sqlite3 connections are per-thread
+        con = self._conn()
+        con.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(str(self.db_path), timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def load(self, file: Path, readonly: bool = False) -> dict:
+        con = self._conn()
+        if _is(file, SUBMISSIONS_FILE):
+            out = {}
+            for student, ex_id, data in con.execute(
+                    "SELECT student, ex_id, data FROM submissions ORDER BY rowid"):
+                out.setdefault(student, {})[ex_id] = json.loads(data)
+            return out
+        if _is(file, LEADERBOARD_FILE):
+            return dict(con.execute("SELECT student, points FROM leaderboard ORDER BY rowid"))
+        row = con.execute("SELECT data FROM documents WHERE name = ?", (Path(file).name,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def save(self, file: Path, data: dict):
+        con = self._conn()
+        with con:
+            if _is(file, SUBMISSIONS_FILE):
+                rows = [(s, e, json.dumps(sub, ensure_ascii=False))
+                        for s, subs in data.items() for e, sub in subs.items()]
+                con.execute("CREATE TEMP TABLE IF NOT EXISTS _keep (student TEXT, ex_id TEXT)")
+                con.execute("DELETE FROM _keep")
+                con.executemany("INSERT INTO _keep VALUES (?, ?)", [r[:2] for r in rows])
+                con.execute("DELETE FROM submissions WHERE (student, ex_id) NOT IN (SELECT student, ex_id FROM _keep)")
+                con.executemany(
+                    "INSERT INTO submissions (student, ex_id, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT (student, ex_id) DO UPDATE SET data = excluded.data", rows)
+            elif _is(file, LEADERBOARD_FILE):
+                con.execute("DELETE FROM leaderboard")
+                con.executemany("INSERT INTO leaderboard (student, points) VALUES (?, ?)", list(data.items()))
+            else:
+                con.execute(
+                    "INSERT INTO documents (name, data) VALUES (?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET data = excluded.data",
+                    (Path(file).name, json.dumps(data, ensure_ascii=False)))
+
+    def is_empty(self) -> bool:
+        con = self._conn()
+        return not any(con.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+                       for table in ("submissions", "leaderboard", "documents"))
+
+    def merge(self, file: Path, data: dict):
+        """Upsert every row of data; unlike save(), rows missing from data are left alone."""
+        con = self._conn()
+        with con:
+            if _is(file, SUBMISSIONS_FILE):
+                con.executemany(
+                    "INSERT INTO submissions (student, ex_id, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT (student, ex_id) DO UPDATE SET data = excluded.data",
+                    [(s, e, json.dumps(sub, ensure_ascii=False)) for s, subs in data.items() for e, sub in subs.items()])
+            elif _is(file, LEADERBOARD_FILE):
+                con.executemany(
+                    "INSERT INTO leaderboard (student, points) VALUES (?, ?) "
+                    "ON CONFLICT (student) DO UPDATE SET points = excluded.points", list(data.items()))
+            else:
+                self.save(file, data)  # one document per file: already an upsert
+
+    def student_submissions(self, student: str) -> dict:
+        rows = self._conn().execute(
+            "SELECT ex_id, data FROM submissions WHERE student = ? ORDER BY rowid", (student,))
+        return {ex_id: json.loads(data) for ex_id, data in rows}
+
+    def put_submission(self, student: str, ex_id: str, sub: dict):
+        con = self._conn()
+        with con:
+            con.execute(
+                "INSERT INTO submissions (student, ex_id, data) VALUES (?, ?, ?) "
+                "ON CONFLICT (student, ex_id) DO UPDATE SET data = excluded.data",
+                (student, ex_id, json.dumps(sub, ensure_ascii=False)))
+
+    def update_submission(self, student: str, ex_id: str, mutate):
+        con = self._conn()
+        with con:
+            con.execute("BEGIN IMMEDIATE")  # take the write lock before reading
+            row = con.execute("SELECT data FROM submissions WHERE student = ? AND ex_id = ?",
+                              (student, ex_id)).fetchone()
+            sub = mutate(json.loads(row[0]) if row else None)
+            if sub is not None:
+                con.execute(
+                    "INSERT INTO submissions (student, ex_id, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT (student, ex_id) DO UPDATE SET data = excluded.data",
+                    (student, ex_id, json.dumps(sub, ensure_ascii=False)))
+            return sub
+
+    def update_submissions(self, mutations: dict) -> set:
+        written = set()
+        con = self._conn()
+        with con:
+            con.execute("BEGIN IMMEDIATE")
+            for (student, ex_id), mutate in mutations.items():
+                row = con.execute("SELECT data FROM submissions WHERE student = ? AND ex_id = ?",
+                                  (student, ex_id)).fetchone()
+                sub = mutate(json.loads(row[0]) if row else None)
+                if sub is not None:
+                    con.execute(
+                        "INSERT INTO submissions (student, ex_id, data) VALUES (?, ?, ?) "
+                        "ON CONFLICT (student, ex_id) DO UPDATE SET data = excluded.data",
+                        (student, ex_id, json.dumps(sub, ensure_ascii=False)))
+                    written.add((student, ex_id))
+        return written
+
+    def add_points(self, student: str, points: int):
+        con = self._conn()
+        with con:
+            con.execute(
+                "INSERT INTO leaderboard (student, points) VALUES (?, ?) "
+                "ON CONFLICT (student) DO UPDATE SET points = points + excluded.points",
+                (student, points))
+
+    def iter_submissions(self):
+        for student, ex_id, data in self._conn().execute(
+                "SELECT student, ex_id, data FROM submissions ORDER BY rowid"):
+            yield student, ex_id, json.loads(data)
+
+    def students(self) -> list:
+        return [r[0] for r in self._conn().execute(
+            "SELECT student FROM submissions GROUP BY student ORDER BY MIN(rowid)")]
+
+# ---------------- Backend selection ----------------
+_BACKENDS = {"json": JSONStorage, "journal": JournalStorage, "sharded": ShardedStorage, "sqlite": SQLiteStorage}
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage() -> Storage:
+    """Process-wide backend chosen by EDUAPP_STORAGE (default: json)."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                name = os.getenv("EDUAPP_STORAGE", "json").strip().lower()
+                _storage = _BACKENDS.get(name, JSONStorage)()
+    return _storage
+
+def load_json(file: Path, readonly: bool = False):
+    return get_storage().load(file, readonly)
+
+def save_json(file: Path, data):
+    get_storage().save(file, data)
+
+# ---------------- Content-addressed text blobs ----------------
+# Submissions reference the exercise texts they were made against by SHA-1
+# ("source_ref"/"mt_ref") instead of copying them into every record; the text
+# itself is written once to data/blobs/<aa>/<sha1>.txt. Older records that
+# still carry "source_text"/"mt_text" inline keep working through resolve_text().
+BLOBS_DIR = DATA_DIR / "blobs"
+_REF_FIELDS = {"source_text": "source_ref", "mt_text": "mt_ref"}
+
+def _blob_path(ref: str) -> Path:
+    return BLOBS_DIR / ref[:2] / f"{ref}.txt"
+
+def put_text(text: str | None) -> str | None:
+    """Store text once (idempotent) and return its ref; None stays None."""
+    if text is None:
+        return None
+    ref = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    path = _blob_path(ref)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(f"{path}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(text, encoding="utf-8")
+        tmp.replace(path)
+    return ref
+
+_text_lru = OrderedDict()  # ref -> text, only for blobs that were read
+_text_lock = threading.Lock()
+_TEXT_LRU_SIZE = 1024
+
+def get_text(ref: str) -> str:
+    """
+    The text stored under ref, or "" if that blob isn't there (yet). Blobs are
+    immutable, so successful reads are cached; a miss is not, because another
+    replica may still be writing it.
+    """
+    with _text_lock:
+        if ref in _text_lru:
+            _text_lru.move_to_end(ref)
+            return _text_lru[ref]
+    try:
+        text = _blob_path(ref).read_text(encoding="utf-8")
+    except (FileNotFoundError, ValueError):
+        return ""
+    with _text_lock:
+        _text_lru[ref] = text
+        while len(_text_lru) > _TEXT_LRU_SIZE:
+            _text_lru.popitem(last=False)
+    return text
+
+def resolve_text(sub: dict, field: str):
+    """sub["source_text"] / sub["mt_text"], whether stored inline or by ref."""
+    if field in sub:
+        return sub[field]
+    ref = sub.get(_REF_FIELDS.get(field, ""))
+    return get_text(ref) if ref else None
+
+def pack_texts(sub: dict) -> dict:
+    """Copy of sub with inline exercise texts swapped for blob refs."""
+    out = dict(sub)
+    for field, ref_field in _REF_FIELDS.items():
+        if field in out:
+            out[ref_field] = put_text(out.pop(field))
+    return out
+
+def dedupe_submissions() -> int:
+    """Rewrite stored submissions so exercise texts live in the blob store."""
+    storage = get_storage()
+
+    def _pack(sub):
+        # re-checked under the storage lock: a submit or grade since the scan wins
+        if sub is None or not any(field in sub for field in _REF_FIELDS):
+            return None
+        return pack_texts(sub)
+
+    todo = {(student, ex_id): _pack for student, ex_id, sub in storage.iter_submissions()
+            if any(field in sub for field in _REF_FIELDS)}
+    return len(storage.update_submissions(todo)) if todo else 0
+
+# ---------------- One-shot migration ----------------
+def migrate_json_to_sqlite(data_dir: Path = DATA_DIR, db_path: Path | None = None, force: bool = False) -> dict:
+    """
+    Copy exercises/submissions/leaderboard from data_dir/*.json (plus journals) into SQLite.
+    Refuses to touch a database that already holds data (it may be live and newer than
+    the JSON files) unless force=True; then the JSON rows are upserted one by one and
+    rows that exist only in the database are kept. The JSON files are left untouched.
+    Returns counts per file.
+    """
+    data_dir = Path(data_dir)
+    src = JournalStorage()  # also folds any pending journal lines
+    dst = SQLiteStorage(db_path or data_dir / SQLITE_FILE.name)
+    if not force and not dst.is_empty():
+        raise RuntimeError(f"{dst.db_path} already holds data; re-run with --force to merge the JSON rows into it")
+    counts = {}
+    for target in (EXERCISES_FILE, SUBMISSIONS_FILE, LEADERBOARD_FILE):
+        data = src.load(data_dir / target.name)
+        dst.merge(target, data)
+        if _is(target, SUBMISSIONS_FILE):
+            counts[target.name] = sum(len(v) for v in data.values())
+        else:
+            counts[target.name] = len(data)
+    return counts
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="EduApp storage utilities")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    mig = sub.add_parser("migrate", help="copy data/*.json into the SQLite backend")
+    mig.add_argument("--data-dir", default=str(DATA_DIR))
+    mig.add_argument("--db", default=None, help="SQLite file (default: <data-dir>/eduapp.sqlite3)")
+    mig.add_argument("--force", action="store_true",
+                     help="merge into a database that already has data (JSON rows win, nothing is deleted)")
+    sub.add_parser("dedupe", help="move exercise texts in stored submissions into data/blobs/")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "migrate":
+        try:
+            counts = migrate_json_to_sqlite(Path(args.data_dir), Path(args.db) if args.db else None, args.force)
+        except RuntimeError as e:
+            sys.exit(f"Not migrating: {e}")
+        for name, n in counts.items():
+            print(f"{name}: {n} record(s) migrated")
+        print("Set EDUAPP_STORAGE=sqlite to use it.")
+    elif args.cmd == "dedupe":
+        print(f"{dedupe_submissions()} submission(s) now reference shared exercise texts.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The app modules live at the repository root (no package); spawned worker
+# processes inherit sys.path from here.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
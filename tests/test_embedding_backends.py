@@ -0,0 +1,27 @@
+"""
+Every non-default embedding backend must give the fp32 SentenceCosine_Ref /
+SentenceCosine_Source within embedding_core.check_backend's default tolerance on
+its sample records. Skipped without sentence-transformers (and, for the ONNX
+backends, onnxruntime + optimum) or when the model can't be downloaded.
+"""
+
+import importlib.util
+
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+import embedding_core
+from embedding_core import BACKENDS, SAMPLE_RECORDS, check_backend
+
+@pytest.mark.parametrize("backend", [b for b in BACKENDS if b != "torch"])
+def test_backend_within_tolerance(backend, tmp_path, monkeypatch):
+    if backend.startswith("onnx") and not all(importlib.util.find_spec(m) for m in ("onnxruntime", "optimum")):
+        pytest.skip("the ONNX backends need onnxruntime and optimum")
+    monkeypatch.setattr(embedding_core, "MODEL_DIR", tmp_path)  # local int8 export, if any
+    try:
+        report = check_backend(backend, SAMPLE_RECORDS)
+    except OSError as e:
+        pytest.skip(f"model not available offline: {e}")
+    assert report["ok"], report
+    assert report["SentenceCosine_Ref"]["pairs"] == len(SAMPLE_RECORDS)
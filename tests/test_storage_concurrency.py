@@ -0,0 +1,63 @@
+"""
+Several processes hammering one data directory: every backend must keep every
+update (cross-process file locks + optimistic retry for JSON, the journal lock,
+per-shard updates, SQLite transactions).
+
+storage_core reads EDUAPP_DATA_DIR at import, so the workers and the final
+check run in spawned processes that import it fresh against a temporary
+directory; this module never imports it itself.
+"""
+
+import os
+import multiprocessing
+
+import pytest
+
+WORKERS = 4
+ROUNDS = 25
+
+def _worker(backend, worker):
+    from storage_core import LEADERBOARD_FILE, get_storage
+    storage = get_storage()
+    for i in range(ROUNDS):
+        # a read-modify-write on one record every worker touches
+        storage.update_submission("shared", "counter", lambda sub: {"n": (sub or {}).get("n", 0) + 1})
+        # a record of its own, on a student shared with another worker
+        storage.put_submission(f"student{worker % 2}", f"w{worker}-{i}", {"worker": worker, "round": i})
+        storage.add_points(f"student{worker % 2}", 1)
+        if backend != "sqlite":
+            # the generic JSON read-modify-write, on a document every worker touches
+            def _bump(doc):
+                doc["bumps"] = doc.get("bumps", 0) + 1
+            storage.update(LEADERBOARD_FILE.with_name("counters.json"), _bump)
+    return worker
+
+def _snapshot(backend):
+    from storage_core import LEADERBOARD_FILE, get_storage, load_json
+    storage = get_storage()
+    subs = {}
+    for student, ex_id, sub in storage.iter_submissions():
+        subs.setdefault(student, {})[ex_id] = sub
+    counters = {} if backend == "sqlite" else load_json(LEADERBOARD_FILE.with_name("counters.json"))
+    return subs, load_json(LEADERBOARD_FILE), counters
+
+@pytest.mark.parametrize("backend", ["json", "journal", "sharded", "sqlite"])
+def test_no_lost_updates(backend, tmp_path, monkeypatch):
+    # spawned children get a copy of os.environ as it is when they start
+    monkeypatch.setenv("EDUAPP_DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("EDUAPP_STORAGE", backend)
+    monkeypatch.setenv("EDUAPP_JOURNAL_MAX_BYTES", "4000")  # compact several times mid-run
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(WORKERS) as pool:
+        assert sorted(pool.starmap(_worker, [(backend, w) for w in range(WORKERS)])) == list(range(WORKERS))
+        subs, leaderboard, counters = pool.apply(_snapshot, (backend,))
+
+    assert subs["shared"]["counter"] == {"n": WORKERS * ROUNDS}
+    for s in (0, 1):
+        mine = subs[f"student{s}"]
+        expected = {f"w{w}-{i}" for w in range(WORKERS) if w % 2 == s for i in range(ROUNDS)}
+        assert set(mine) == expected
+        assert leaderboard[f"student{s}"] == len(expected)
+    if backend != "sqlite":
+        assert counters == {"bumps": WORKERS * ROUNDS}
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
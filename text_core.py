@@ -0,0 +1,145 @@
+# text_core.py — one analysis per text, shared by the whole grading pipeline
+# analyze_text(text) returns an AnalyzedText whose tokens, word offsets, numbers and
+# character counts are computed on first use and then reused: metrics_core (length
+# ratio), diff_core (track changes / edit counts), the hints in main.py and the
+# feedback_core detectors all read the same object instead of re-scanning the text.
+# Results are memoised per text (EDUAPP_TEXT_CACHE, default 512 texts), so an
+# exercise's source/MT text is analysed once for every submission against it.
+# `python text_core.py bench` times the text side of one submit, shared vs not.
+
+import os
+import re
+import time
+import argparse
+from functools import lru_cache, cached_property
+from typing import Tuple
+
+_token_re = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_AR_LETTERS = r"\u0600-\u06FF"  # Arabic Unicode block
+_word_re = re.compile(r"[A-Za-z" + _AR_LETTERS + r"]+[’'\-]?[A-Za-z" + _AR_LETTERS + r"]+|\d+(?:[.,]\d+)?")
+_number_re = re.compile(r"\d+(?:[.,]\d+)?")
+_norm_number_re = re.compile(r"\d+[.,]?\d*")
+
+AR_DIGITS = "٠١٢٣٤٥٦٧٨٩"; FA_DIGITS = "۰۱۲۳۴۵۶۷۸۹"; EN = "0123456789"
+DIGIT_TABLE = str.maketrans({**{a: b for a, b in zip(AR_DIGITS, EN)}, **{a: b for a, b in zip(FA_DIGITS, EN)}})
+COUNTED_CHARS = "()[]{}\""  # brackets and quotes compared between source and target
+
+def _norm_ar(s: str) -> str:
+    return (s or "").replace("أ", "ا").replace("إ", "ا").replace("آ", "ا").replace("ى", "ي").replace("ة", "ه")
+
+class AnalyzedText:
+    """A text plus everything the pipeline derives from it. Attributes are read-only."""
+
+    def __init__(self, text: str):
+        self.text = text or ""
+
+    @cached_property
+    def token_spans(self) -> Tuple[Tuple[int, int], ...]:
+        """(start, end) of each metric/diff token (words and single punctuation marks)."""
+        return tuple(m.span() for m in _token_re.finditer(self.text))
+
+    @cached_property
+    def tokens(self) -> Tuple[str, ...]:
+        return tuple(self.text[s:e] for s, e in self.token_spans)
+
+    @cached_property
+    def words(self) -> Tuple[str, ...]:
+        """Words incl. hyphen/apostrophe compounds, and numbers (the hints' notion of a word)."""
+        return tuple(_word_re.findall(self.text))
+
+    @cached_property
+    def word_set(self) -> frozenset:
+        return frozenset(self.words)
+
+    @cached_property
+    def numbers(self) -> frozenset:
+        """Numbers as written (ASCII digits only)."""
+        return frozenset(_number_re.findall(self.text))
+
+    @cached_property
+    def digits_normalized(self) -> str:
+        """The text with Arabic-Indic and Persian digits mapped to ASCII."""
+        return self.text.translate(DIGIT_TABLE)
+
+    @cached_property
+    def normalized_numbers(self) -> Tuple[str, ...]:
+        """Numbers after digit normalization, trailing/leading separators stripped."""
+        return tuple(x.strip(".,") for x in _norm_number_re.findall(self.digits_normalized))
+
+    @cached_property
+    def whitespace_words(self) -> int:
+        return len(self.text.split())
+
+    @cached_property
+    def char_counts(self) -> dict:
+        return {c: self.text.count(c) for c in COUNTED_CHARS}
+
+    @cached_property
+    def lower(self) -> str:
+        """Lowercased, same length as text (offsets into it are offsets into text)."""
+        low = self.text.lower()
+        if len(low) != len(self.text):  # e.g. "İ" lowercases to two characters
+            low = "".join(c if len(c.lower()) != 1 else c.lower() for c in self.text)
+        return low
+
+    @cached_property
+    def ar_normalized(self) -> str:
+        """Arabic letter variants folded (alef/yaa/taa marbuta), for lexicon lookups."""
+        return _norm_ar(self.text)
+
+@lru_cache(maxsize=int(os.getenv("EDUAPP_TEXT_CACHE", "512")))
+def analyze_text(text: str) -> AnalyzedText:
+    """The shared AnalyzedText for text (memoised)."""
+    return AnalyzedText(text or "")
+
+# ---------------- Benchmark ----------------
+def _submit_text_work(source, mt, student, between=lambda: None):
+    """The text-side work of one post-edit submit; between() runs after each stage."""
+    from diff_core import diff_text
+    from metrics_core import compute_edit_details
+    from feedback_core import analyze
+    len(analyze_text(source).tokens), len(analyze_text(student).tokens)  # length ratio
+    between()
+    compute_edit_details(mt, student)
+    between()
+    analyze(source, student)
+    between()
+    diff_text(mt, student)
+
+def bench(words=400, rounds=50):
+    """Seconds per submit with one shared analysis vs. every stage starting from scratch."""
+    import random
+    from diff_core import edit_script
+    rng = random.Random(0)
+    vocab = [f"w{i}" for i in range(300)] + ["the", "of", ",", ".", "(", ")", "12", "3.5"]
+    source = " ".join(rng.choice(vocab) for _ in range(words))
+    mt = " ".join(rng.choice(vocab) for _ in range(words))
+    student = " ".join(t if rng.random() > 0.15 else rng.choice(vocab) for t in mt.split())
+
+    def _forget():
+        analyze_text.cache_clear()
+        edit_script.cache_clear()
+
+    def _run(between):
+        start = time.perf_counter()
+        for r in range(rounds):
+            _submit_text_work(f"{source} {r}", f"{mt} {r}", f"{student} {r}", between)  # fresh texts
+        return (time.perf_counter() - start) / rounds
+
+    return {"shared": _run(lambda: None), "per_stage": _run(_forget)}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="EduApp text analysis")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("bench", help="time the text side of one submit")
+    b.add_argument("--words", type=int, default=400)
+    b.add_argument("--rounds", type=int, default=50)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "bench":
+        r = bench(args.words, args.rounds)
+        print(f"shared analysis: {r['shared'] * 1000:.2f} ms/submit; "
+              f"re-analysed per stage: {r['per_stage'] * 1000:.2f} ms/submit")
+
+if __name__ == "__main__":
+    main()
@@ -1,301 +1,92 @@
 import streamlit as st
-import json
 import os
 import time
 import re
+import tempfile
 import random
-import threading
-from pathlib import Path
-from typing import List, Tuple
-from difflib import SequenceMatcher, ndiff
 from io import BytesIO
+from functools import partial
 
 import requests  # used by ai_generate_text
-import pandas as pd
 from docx import Document
-from docx.shared import RGBColor
-
-# Optional metrics deps (graceful fallback if missing)
-try:
-    import sacrebleu
-except Exception:
-    sacrebleu = None
-
-try:
-    from bert_score import score as bertscore_score
-except Exception:
-    bertscore_score = None
-
-# --- Optional deps for sentence-level cosine similarity (safe fallbacks) ---
-try:
-    import numpy as np
-except Exception:
-    np = None
-
-try:
-    from sentence_transformers import SentenceTransformer
-except Exception:
-    SentenceTransformer = None
-
-# ---------------- Storage (JSON with basic locking & atomic writes) ----------------
-DATA_DIR = Path("./data")
-DATA_DIR.mkdir(exist_ok=True)
-
-EXERCISES_FILE = DATA_DIR / "exercises.json"
-SUBMISSIONS_FILE = DATA_DIR / "submissions.json"
-LEADERBOARD_FILE = DATA_DIR / "leaderboard.json"
-
-_lock = threading.Lock()
-
-# -------- Sentence-level Cosine Similarity (safe, optional) --------
-_st_model = None
-_st_model_tried = False
-_st_model_name = "sentence-transformers/all-MiniLM-L6-v2"  # small & fast
-
-def get_sentence_model():
-    """Load sentence-transformer once; return None if unavailable/fails."""
-    global _st_model, _st_model_tried
-    if _st_model is not None or _st_model_tried:
-        return _st_model
-    _st_model_tried = True
-    try:
-        if SentenceTransformer is None:
-            return None
-        _st_model = SentenceTransformer(_st_model_name)
-    except Exception:
-        _st_model = None
-    return _st_model
 
-def _cosine(u, v):
-    """Manual cosine similarity; returns None on any issue."""
-    try:
-        if np is None:
-            return None
-        u = np.asarray(u, dtype=float)
-        v = np.asarray(v, dtype=float)
-        nu = np.linalg.norm(u)
-        nv = np.linalg.norm(v)
-        if nu == 0.0 or nv == 0.0:
-            return None
-        return float(np.dot(u, v) / (nu * nv))
-    except Exception:
-        return None
+from lazy_core import lazy_import
+pd = lazy_import("pandas")  # imported on first use (see lazy_core.py)
 
-def sentence_cosine(a: str, b: str) -> float | None:
-    """Cosine similarity in [-1,1] between sentence embeddings, or None."""
-    try:
-        model = get_sentence_model()
-        if model is None:
-            return None
-        embs = model.encode([a or "", b or ""], normalize_embeddings=False)
-        return _cosine(embs[0], embs[1])
-    except Exception:
-        return None
+# ---------------- Storage (pluggable: JSON files by default, SQLite via EDUAPP_STORAGE) ----------------
+from storage_core import (
+    EXERCISES_FILE, LEADERBOARD_FILE,
+    load_json, save_json, get_storage, put_text,
+)
 
-def load_json(file: Path):
-    file = Path(file)
-    if file.exists():
-        with file.open("r", encoding="utf-8") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                # If a previous run got interrupted; return empty dict rather than crashing
-                return {}
-    return {}
-
-def save_json(file: Path, data):
-    with _lock:
-        tmp = Path(str(file) + ".tmp")
-        with tmp.open("w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-        tmp.replace(file)
-
-# ---------------- Tokenization & Edit Helpers ----------------
-_token_re = re.compile(r"\w+|[^\w\s]", re.UNICODE)
-
-def _tokenize(s: str) -> List[str]:
-    return _token_re.findall(s or "")
-
-def compute_edit_details(mt_text: str, student_text: str) -> Tuple[int, int, int]:
-    """
-    Token-level edit summary:
-    additions, deletions, total_edits
-    (replace counts as max span length, i.e., single op per replaced region)
-    """
-    mt_tokens = _tokenize(mt_text)
-    st_tokens = _tokenize(student_text)
-    matcher = SequenceMatcher(None, mt_tokens, st_tokens)
-
-    additions = deletions = replacements = 0
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-        if tag == "insert":
-            additions += (j2 - j1)
-        elif tag == "delete":
-            deletions += (i2 - i1)
-        elif tag == "replace":
-            replacements += max(i2 - i1, j2 - j1)
-    total_edits = additions + deletions + replacements
-    return additions, deletions, total_edits
-
-# ---------------- Metrics ----------------
-def evaluate_translation(student_text, mt_text=None, reference=None, task_type="Translate", source_text=""):
-    """
-    Returns a metrics dict using:
-      - length_ratio (target tokens / source tokens)
-      - BLEU (sacrebleu, if reference provided)
-      - chrF++ (sacrebleu, if reference provided)
-      - BERTScore_F1 (if available & reference provided)
-      - sentence-level cosine similarities (candidate vs reference & vs source)
-      - edit counts for post-edit tasks
-    All metrics gracefully fallback to None if libs or references are missing.
-    """
-    src_len = max(1, len(_tokenize(source_text)))
-    tgt_len = len(_tokenize(student_text))
-    length_ratio = round(tgt_len / src_len, 3)
-
-    if task_type == "Post-edit MT" and mt_text:
-        additions, deletions, edits = compute_edit_details(mt_text, student_text)
-    else:
-        additions = deletions = edits = 0
-
-    bleu = chrf = bert_f1 = None
-    if reference:
-        refs = [reference]
-        try:
-            if sacrebleu:
-                bleu = float(sacrebleu.corpus_bleu([student_text], [refs]).score)  # 0-100
-                chrf = float(sacrebleu.corpus_chrf([student_text], [refs]).score)  # 0-100
-        except Exception:
-            bleu = bleu if isinstance(bleu, (int, float)) else None
-            chrf = chrf if isinstance(chrf, (int, float)) else None
-
-        try:
-            if bertscore_score:
-                P, R, F1 = bertscore_score([student_text], [reference], lang="en")
-                bert_f1 = float(F1.mean().item())  # 0-1
-        except Exception:
-            bert_f1 = None
-
-    # --- New: sentence-level cosine similarities (safe fallbacks to None) ---
-    sent_cos_ref = sentence_cosine(student_text, reference) if reference else None
-    sent_cos_src = sentence_cosine(student_text, source_text) if source_text else None
-
-    return {
-        "length_ratio": length_ratio,
-        "BLEU": None if bleu is None else round(bleu, 2),
-        "chrF++": None if chrf is None else round(chrf, 2),
-        "BERTScore_F1": None if bert_f1 is None else round(bert_f1, 3),
-        "SentenceCosine_Ref": None if sent_cos_ref is None else round(sent_cos_ref, 3),
-        "SentenceCosine_Source": None if sent_cos_src is None else round(sent_cos_src, 3),
-        "additions": additions,
-        "deletions": deletions,
-        "edits": edits
-    }
-
-# ---------------- Track Changes (HTML + DOCX) ----------------
-def _join_tokens_for_display(tokens: List[str]) -> str:
-    # Join tokens with spaces, then clean spaces before punctuation
-    out = " ".join(tokens)
-    out = re.sub(r"\s+([.,!?;:])", r"\1", out)
-    return out
-
-def diff_text(baseline: str, student_text: str) -> str:
-    differ = ndiff(_tokenize(baseline), _tokenize(student_text))
-    parts = []
-    for w in differ:
-        token = w[2:]
-        if w.startswith("- "):
-            parts.append(f"<span style='color:#c00;text-decoration:line-through'>{token}</span>")
-        elif w.startswith("+ "):
-            parts.append(f"<span style='color:#080'>{token}</span>")
-        else:
-            parts.append(token)
-    return _join_tokens_for_display(parts)
-
-def add_diff_to_doc(doc: Document, baseline: str, student_text: str):
-    differ = ndiff(_tokenize(baseline), _tokenize(student_text))
-    p = doc.add_paragraph()
-    for w in differ:
-        token = w[2:]
-        if w.startswith("- "):
-            run = p.add_run(token + " ")
-            run.font.strike = True
-            run.font.color.rgb = RGBColor(255, 0, 0)
-        elif w.startswith("+ "):
-            run = p.add_run(token + " ")
-            run.font.color.rgb = RGBColor(0, 128, 0)
-        else:
-            p.add_run(token + " ")
-
-# ---------------- Word Export ----------------
-def export_student_word(submissions, student_name):
-    doc = Document()
-    doc.add_heading(f"Student: {student_name}", 0)
-    subs = submissions.get(student_name, {})
-    for ex_id, sub in subs.items():
-        doc.add_heading(f"Exercise {ex_id}", level=1)
-        doc.add_paragraph("Source Text:")
-        doc.add_paragraph(sub.get("source_text", ""))
-        if sub.get("mt_text"):
-            doc.add_paragraph("MT Output:")
-            doc.add_paragraph(sub.get("mt_text", ""))
-
-        if sub.get("task_type") == "Post-edit MT":
-            doc.add_paragraph("Student Submission (Track Changes):")
-            base = sub.get("mt_text", "")
-            add_diff_to_doc(doc, base, sub.get("student_text", ""))
-        else:
-            doc.add_paragraph("Student Submission:")
-            doc.add_paragraph(sub.get("student_text", ""))
-
-        metrics = sub.get("metrics", {})
-        doc.add_paragraph(f"Metrics: {metrics}")
-        doc.add_paragraph(f"Task Type: {sub.get('task_type','')}")
-        doc.add_paragraph(f"Time Spent: {sub.get('time_spent_sec', 0):.2f} sec")
-        doc.add_paragraph(f"Characters (not keystrokes): {sub.get('keystrokes', 0)}")
-        doc.add_paragraph("---")
+# ---------------- Sentence Cosine & Metrics (shared, see metrics_core.py) ----------------
+from metrics_core import evaluate_translation, precompute_exercise_embeddings
+
+# ---------------- Background grading (submit returns at once, see grading_core.py) ----------------
+from grading_core import new_job_id, enqueue, job_result, resume_pending, warm_up, pending_fields
+GRADING_APP = "translation_lab"  # tags this app's submissions, so resume/re-grade score them as this app does
+
+# ---------------- Track Changes (HTML + DOCX, see diff_core.py) ----------------
+from diff_core import diff_text
 
+# ---------------- Word Export (cached by content, see export_core.py) ----------------
+from export_core import (
+    SUMMARY_FORMATS, write_summary, deferred, content_key, cached_export,
+    student_report, export_class_zip, class_records, DEFERRED_DOWNLOADS,
+)
+
+def export_exercise_word(ex_id, ex):
+    doc = Document()
+    doc.add_heading(f"Exercise {ex_id}", 0)
+    doc.add_paragraph("Source Text:")
+    doc.add_paragraph(ex.get("source_text", ""))
+    if ex.get("mt_text"):
+        doc.add_paragraph("MT Output:")
+        doc.add_paragraph(ex.get("mt_text", ""))
+    if ex.get("reference_text"):
+        doc.add_paragraph("Reference Translation:")
+        doc.add_paragraph(ex.get("reference_text",""))
     buf = BytesIO()
     doc.save(buf)
     buf.seek(0)
     return buf
 
-# ---------------- Excel Summary Export ----------------
-def export_summary_excel(submissions):
-    rows = []
-    for student, subs in submissions.items():
-        for ex_id, sub in subs.items():
-            m = sub.get("metrics", {})
-            rows.append({
-                "Student": student,
-                "Exercise": ex_id,
-                "Task Type": sub.get("task_type", ""),
-                "Length Ratio": m.get("length_ratio"),
-                "BLEU": m.get("BLEU"),
-                "chrF++": m.get("chrF++"),
-                "BERTScore_F1": m.get("BERTScore_F1"),
-                "SentenceCosine_Ref": m.get("SentenceCosine_Ref"),
-                "SentenceCosine_Source": m.get("SentenceCosine_Source"),
-                "Additions": m.get("additions"),
-                "Deletions": m.get("deletions"),
-                "Edits": m.get("edits"),
-                "Time Spent (s)": sub.get("time_spent_sec", 0),
-                "Characters Typed": sub.get("keystrokes", 0)
-            })
-    df = pd.DataFrame(rows)
-    buf = BytesIO()
-    df.to_excel(buf, index=False)
-    buf.seek(0)
-    return buf
+def export_student_word(submissions, student_name):
+    return student_report(student_name, submissions.get(student_name, {}), reflection=False)
+
+def export_class_word():
+    """Every student's report in one ZIP, built in a temp file on a worker pool."""
+    tmp = tempfile.TemporaryFile(buffering=0)  # raw file object, accepted by st.download_button
+    export_class_zip(class_records(get_storage()), tmp, reflection=False)
+    tmp.seek(0)
+    return tmp
+
+# ---------------- Summary Export (streamed, see export_core.py) ----------------
+def export_summary_excel(records, fmt="xlsx"):
+    """records: iterable of (student, ex_id, submission), e.g. get_storage().iter_submissions()."""
+    tmp = tempfile.TemporaryFile(buffering=0)  # on disk, not in memory, while it is written
+    write_summary(records, tmp, fmt)
+    tmp.seek(0)
+    return tmp
 
 # ---------------- Gamification ----------------
 def update_leaderboard(student_name, points):
-    leaderboard = load_json(LEADERBOARD_FILE)
-    leaderboard[student_name] = leaderboard.get(student_name, 0) + points
-    save_json(LEADERBOARD_FILE, leaderboard)
+    get_storage().add_points(student_name, points)
+
+def submission_points(metrics, task_type):
+    """Leaderboard points for one graded submission (BLEU/chrF++ might be None if no reference)."""
+    points = 0
+    if metrics.get("BLEU") is not None:
+        points += int(metrics["BLEU"])
+    if metrics.get("chrF++") is not None:
+        points += int(metrics["chrF++"] / 2)  # chrF++ is 0-100; dampen
+    if task_type == "Post-edit MT":
+        # reward efficient editing (fewer edits)
+        points += max(0, 10 - int(metrics["edits"]))
+    return points
 
 def show_leaderboard():
-    leaderboard = load_json(LEADERBOARD_FILE)
+    leaderboard = load_json(LEADERBOARD_FILE, readonly=True)
     st.subheader("Leaderboard")
     if leaderboard:
         # Show as dataframe for clarity
@@ -337,7 +128,8 @@ def instructor_dashboard():
         return
 
     exercises = load_json(EXERCISES_FILE)
-    submissions = load_json(SUBMISSIONS_FILE)
+    storage = get_storage()
+    students = storage.students()  # submissions themselves are read per student / streamed
 
     st.subheader("Create / Edit / Delete Exercise")
     ex_ids = ["New"] + list(exercises.keys())
@@ -376,6 +168,8 @@ def instructor_dashboard():
             "reference_text": (ref_text.strip() or None)
         }
         save_json(EXERCISES_FILE, exercises)
+        # embed source/reference now so student submits only encode their own text
+        precompute_exercise_embeddings(exercises[next_id]["source_text"], exercises[next_id]["reference_text"])
         st.success(f"Exercise saved! ID: {next_id}")
 
     if delete_btn and selected_ex != "New":
@@ -396,22 +190,10 @@ def instructor_dashboard():
     st.subheader("Download Exercises")
     if exercises:
         for ex_id, ex in exercises.items():
-            buf = BytesIO()
-            doc = Document()
-            doc.add_heading(f"Exercise {ex_id}", 0)
-            doc.add_paragraph("Source Text:")
-            doc.add_paragraph(ex.get("source_text", ""))
-            if ex.get("mt_text"):
-                doc.add_paragraph("MT Output:")
-                doc.add_paragraph(ex.get("mt_text", ""))
-            if ex.get("reference_text"):
-                doc.add_paragraph("Reference Translation:")
-                doc.add_paragraph(ex.get("reference_text",""))
-            doc.save(buf)
-            buf.seek(0)
+            key = content_key("exercise_word", ex_id, ex)  # rebuilt only when the exercise changes
             st.download_button(
                 f"Exercise {ex_id} (Word)",
-                buf,
+                deferred(partial(cached_export, key, export_exercise_word, ex_id, ex)),
                 file_name=f"Exercise_{ex_id}.docx",
                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
             )
@@ -419,25 +201,37 @@ def instructor_dashboard():
         st.info("No exercises yet.")
 
     st.subheader("Student Submissions & Exports")
-    if submissions:
-        student_choice = st.selectbox("Choose student", ["All"] + list(submissions.keys()))
+    if students:
+        student_choice = st.selectbox("Choose student", ["All"] + students)
         if student_choice != "All":
-            buf = export_student_word(submissions, student_choice)
+            chosen = {student_choice: storage.student_submissions(student_choice)}
+            key = content_key("student_word", chosen)  # reused until this student's records change
             safe_name = re.sub(r"[^\w\-]+", "_", student_choice)
             st.download_button(
                 f"Download {student_choice}'s Submissions (Word)",
-                buf,
+                deferred(partial(cached_export, key, export_student_word, chosen, student_choice)),
                 file_name=f"{safe_name}_submissions.docx",
                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
             )
 
-        st.subheader("Download Metrics Summary (Excel)")
-        excel_buf = export_summary_excel(submissions)
+        st.subheader("Export Whole Class (Word, ZIP)")
+        # Without deferred downloads the ZIP would be rebuilt on every rerun; ask first
+        if DEFERRED_DOWNLOADS or st.button("Prepare class ZIP"):
+            st.download_button(
+                "Download All Students (ZIP)",
+                deferred(export_class_word),
+                file_name="class_submissions.zip",
+                mime="application/zip"
+            )
+
+        st.subheader("Download Metrics Summary")
+        fmt_label = st.radio("Summary format", list(SUMMARY_FORMATS), horizontal=True)
+        ext, mime = SUMMARY_FORMATS[fmt_label]
         st.download_button(
-            "Download Excel Summary",
-            excel_buf,
-            file_name="metrics_summary.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            f"Download {fmt_label} Summary",
+            deferred(lambda: export_summary_excel(storage.iter_submissions(), ext)),  # streamed, built on click
+            file_name=f"metrics_summary.{ext}",
+            mime=mime
         )
 
         show_leaderboard()
@@ -448,19 +242,17 @@ def instructor_dashboard():
 def student_dashboard():
     st.title("Student Dashboard")
 
-    exercises = load_json(EXERCISES_FILE)
+    exercises = load_json(EXERCISES_FILE, readonly=True)
     if not exercises:
         st.info("No exercises available yet. Please check back later.")
         return
 
-    submissions = load_json(SUBMISSIONS_FILE)
     student_name = st.text_input("Enter your name")
     if not student_name:
         return
 
-    # Ensure per-student container in JSON
-    if student_name not in submissions:
-        submissions[student_name] = {}
+    # Only this student's submissions are read/written (a single row upsert on SQLite)
+    my_submissions = get_storage().student_submissions(student_name)
 
     ex_id = st.selectbox("Choose Exercise", list(exercises.keys()))
     if not ex_id:
@@ -494,48 +286,77 @@ def student_dashboard():
         )
         submitted = st.form_submit_button("Submit")
 
+    job_key = f"grading_{student_name}_{ex_id}"
     if submitted:
         time_spent = time.time() - st.session_state[start_key]
         st.session_state[keys_key] = len(student_text)  # characters typed proxy
 
-        metrics = evaluate_translation(
-            student_text,
-            mt_text=ex.get("mt_text"),
-            reference=ex.get("reference_text"),  # now wired to gold reference if provided
-            task_type=task_type,
-            source_text=ex.get("source_text", "")
-        )
-
-        # Persist submission
-        submissions[student_name][ex_id] = {
-            "source_text": ex.get("source_text", ""),
-            "mt_text": ex.get("mt_text"),
+        # Persist right away; the metrics are filled in by a background worker
+        job_id = new_job_id()
+        my_submissions[ex_id] = {
+            "source_ref": put_text(ex.get("source_text", "")),  # texts stored once, by hash
+            "mt_ref": put_text(ex.get("mt_text")),
             "student_text": student_text,
             "task_type": task_type,
             "time_spent_sec": round(time_spent, 2),
             "keystrokes": st.session_state[keys_key],  # actually characters
-            "metrics": metrics
+            "metrics": {},
+            **pending_fields(job_id, GRADING_APP),  # status, job_id, lease to this process
+        }
+        get_storage().put_submission(student_name, ex_id, my_submissions[ex_id])
+        enqueue(student_name, ex_id, job_id, _grading_inputs(ex, student_text, task_type),
+                evaluate_translation, submission_points)
+        st.session_state[job_key] = {
+            "job_id": job_id, "student_text": student_text, "task_type": task_type,
+            "time_spent": time_spent, "chars": st.session_state[keys_key], "metrics": None,
         }
-        save_json(SUBMISSIONS_FILE, submissions)
-
-        # Gamification points (BLEU/chrF++ might be None if no reference)
-        points = 0
-        if metrics.get("BLEU") is not None:
-            points += int(metrics["BLEU"])
-        if metrics.get("chrF++") is not None:
-            points += int(metrics["chrF++"] / 2)  # chrF++ is 0-100; dampen
-        if task_type == "Post-edit MT":
-            # reward efficient editing (fewer edits)
-            points += max(0, 10 - int(metrics["edits"]))
-        update_leaderboard(student_name, points)
-
-        st.success("Submission saved!")
-
-        # Show metrics neatly
-        st.subheader("Your Metrics")
-        def _fmt(v):
-            return "—" if v is None else v
-        st.markdown(f"""
+        st.success("Submission saved! Your scores will appear below in a moment.")
+
+    job = st.session_state.get(job_key)
+    if job is None:
+        return
+    if job["metrics"] is None:
+        _poll_grading(job, student_name, ex_id)
+        return
+    show_results(job, ex)
+
+def _grading_inputs(ex, student_text, task_type):
+    return dict(
+        student_text=student_text,
+        mt_text=ex.get("mt_text"),
+        reference=ex.get("reference_text"),  # now wired to gold reference if provided
+        task_type=task_type,
+        source_text=ex.get("source_text", ""),
+    )
+
+def _resume_inputs(student, ex_id, sub):
+    """Rebuild the evaluate kwargs of a submission left pending by a restart."""
+    ex = load_json(EXERCISES_FILE, readonly=True).get(ex_id)
+    if ex is None:
+        return None
+    return _grading_inputs(ex, sub.get("student_text", ""), sub.get("task_type", "Translate"))
+
+@st.fragment(run_every=2)
+def _poll_grading(job, student_name, ex_id):
+    """Re-runs on its own every 2s until the worker has stored the metrics."""
+    metrics = job_result(job["job_id"], student_name, ex_id)
+    if metrics is None:
+        st.info("⏳ Scoring your submission…")
+        return
+    job["metrics"] = metrics
+    st.rerun()
+
+def show_results(job, ex):
+    metrics = job["metrics"]
+    if not metrics:
+        st.warning("Your submission is saved, but scoring failed. Your instructor can re-grade it.")
+        return
+
+    # Show metrics neatly
+    st.subheader("Your Metrics")
+    def _fmt(v):
+        return "—" if v is None else v
+    st.markdown(f"""
 - **Length Ratio** (target/src): {_fmt(metrics['length_ratio'])}
 - **BLEU**: {_fmt(metrics['BLEU'])}
 - **chrF++**: {_fmt(metrics['chrF++'])}
@@ -545,20 +366,22 @@ def student_dashboard():
 - **Additions**: {_fmt(metrics['additions'])}
 - **Deletions**: {_fmt(metrics['deletions'])}
 - **Edits**: {_fmt(metrics['edits'])}
-- **Time Spent**: {round(time_spent, 2)} sec
-- **Characters Typed**: {st.session_state[keys_key]}
+- **Time Spent**: {round(job['time_spent'], 2)} sec
+- **Characters Typed**: {job['chars']}
 """)
 
-        if task_type == "Post-edit MT":
-            st.subheader("Track Changes")
-            base = ex.get("mt_text", "") or ""
-            st.markdown(diff_text(base, student_text), unsafe_allow_html=True)
+    if job["task_type"] == "Post-edit MT":
+        st.subheader("Track Changes")
+        base = ex.get("mt_text", "") or ""
+        st.markdown(diff_text(base, job["student_text"]), unsafe_allow_html=True)
 
-        show_leaderboard()
+    show_leaderboard()
 
 # ---------------- Main ----------------
 def main():
     st.set_page_config(page_title="Translation Lab", layout="wide")
+    warm_up(models=("bertscore", "sentence"))  # model load (here or in the grading workers); no-op once loaded
+    resume_pending(evaluate_translation, submission_points, _resume_inputs, GRADING_APP)  # once per process
     st.sidebar.title("Navigation")
     role = st.sidebar.radio("Login as", ["Instructor", "Student"], index=1)
     if role == "Instructor":
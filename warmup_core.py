@@ -0,0 +1,160 @@
+# warmup_core.py — background model warm-up and readiness probe
+# start() (called by grading_core.warm_up on the first page load) loads the metric
+# models the app uses in a daemon thread, so the first student after a deploy doesn't wait
+# for them. A failed load is retried with backoff (see metrics_core.ModelLoader) up
+# to EDUAPP_MODEL_RETRIES times.
+# - Models: each app names the ones it scores with, warm_up(models=...) (main.py: none,
+#   translation_lab.py: "bertscore" and "sentence"; default both). EDUAPP_WARM_MODELS,
+#   comma-separated (empty = none), overrides the app's choice when set.
+# - status(): load state and duration per model, and "ready" once every selected
+#   model is loaded (or its library isn't installed, the metric is then None).
+# - Probe: with EDUAPP_HEALTH_PORT set, a tiny HTTP server answers GET /healthz
+#   (200 while the process is up) and GET /readyz (200 when ready, else 503; JSON body
+#   = status()) for the orchestrator to gate traffic on.
+# - With a shared model server configured (EDUAPP_MODEL_SERVER, see serving_core.py)
+#   nothing is loaded here; status() reports the server's readiness instead (or ready
+#   at once if the app uses no models).
+# - `python warmup_core.py load [--models ...]` loads the models in the foreground and prints the
+#   status (e.g. to fill the model cache while building an image).
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import serving_core
+
+_lock = threading.Lock()
+_thread = None
+_server = None
+_workers = []  # process mode: futures of the worker warm-up jobs (see grading_core.warm_up)
+DEFAULT_MODELS = ("bertscore", "sentence")
+_models = DEFAULT_MODELS  # what this process's app scores with (select())
+
+def _retries() -> int:
+    return max(1, int(os.getenv("EDUAPP_MODEL_RETRIES", "5")))
+
+def select(models=None):
+    """Set the models this process warms up and reports on (None keeps the current choice)."""
+    global _models
+    if models is not None:
+        _models = tuple(models)
+
+def model_names() -> list:
+    """EDUAPP_WARM_MODELS if set, else the app's selection."""
+    env = os.getenv("EDUAPP_WARM_MODELS")
+    names = _models if env is None else env.split(",")
+    return [n.strip() for n in names if n.strip()]
+
+def loaders() -> list:
+    """The ModelLoaders of model_names() (none when the model server holds them)."""
+    if serving_core.configured():
+        return []
+    from metrics_core import bert_loader, sentence_loader
+    known = {"bertscore": bert_loader, "sentence": sentence_loader}
+    return [known[n] for n in model_names() if n in known]
+
+def load_all(retries: int | None = None, sleep=time.sleep):
+    """Load every configured model, waiting out the backoff between attempts (blocking)."""
+    retries = retries or _retries()
+    for loader in loaders():
+        while loader.get() is None and loader.status == "failed" and loader.attempts < retries:
+            sleep(max(0.0, loader.retry_at - time.monotonic()))
+    return model_states()
+
+def model_states() -> list:
+    return [loader.state() for loader in loaders()]
+
+def _settled(states) -> bool:
+    return all(s["status"] in ("ready", "unavailable") for s in states)
+
+def start(models=None):
+    """Once per process: warm up `models` (see select()) in the background and serve the probe if configured."""
+    global _thread
+    select(models)
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=load_all, name="model-warmup", daemon=True)
+            _thread.start()
+    serve_probe()
+
+def track_workers(futures):
+    """Process mode: the models load in the grading workers; readiness waits for them."""
+    with _lock:
+        _workers.extend(futures)
+
+def status() -> dict:
+    """{"ready": bool, "models": [state per model], "workers": [...] in process mode}."""
+    if serving_core.configured() and model_names():
+        remote = serving_core.remote_status()
+        return {"ready": bool(remote and remote.get("ready")), "mode": "model-server", "server": remote}
+    with _lock:
+        workers = list(_workers)
+    if workers:
+        done = [f for f in workers if f.done()]
+        reports = []
+        for f in done:
+            try:
+                reports.append(f.result())
+            except Exception as e:
+                reports.append({"pid": None, "models": [], "error": f"{type(e).__name__}: {e}"})
+        ready = len(done) == len(workers) and all(r.get("error") is None and _settled(r["models"]) for r in reports)
+        return {"ready": ready, "mode": "process", "workers": reports, "pending_workers": len(workers) - len(done)}
+    states = model_states()
+    return {"ready": _thread is not None and _settled(states), "mode": "thread", "models": states}
+
+# ---------------- Probe ----------------
+class _Probe(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/healthz":
+            code, body = 200, {"alive": True}
+        elif path == "/readyz":
+            body = status()
+            code = 200 if body["ready"] else 503
+        else:
+            code, body = 404, {"error": "not found"}
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass  # probes hit this every few seconds
+
+def serve_probe(port: int | None = None):
+    """Start the /healthz + /readyz server (EDUAPP_HEALTH_PORT) once; no-op if unset or taken."""
+    global _server
+    port = port or int(os.getenv("EDUAPP_HEALTH_PORT", "0"))
+    with _lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((os.getenv("EDUAPP_HEALTH_HOST", "0.0.0.0"), port), _Probe)
+        except OSError:
+            return None  # another process of this replica already serves it
+        _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="health-probe", daemon=True).start()
+    return _server
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="EduApp model warm-up")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ld = sub.add_parser("load", help="load the models now and print their status")
+    ld.add_argument("--models", default=None, help=f"comma-separated (default: {','.join(DEFAULT_MODELS)})")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "load":
+        if args.models is not None:
+            select(args.models.split(","))
+        states = load_all()
+        print(json.dumps(states, indent=2))
+        sys.exit(0 if _settled(states) else 1)
+
+if __name__ == "__main__":
+    main()